@@ -1,13 +1,20 @@
 import os
 from pathlib import Path
+import re
 import shutil
 import tempfile
-from typing import List
+from typing import List, Optional
 import gradio as gr
 import uuid
 from typing_extensions import TypedDict, Tuple
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Request
+from pydantic import BaseModel, Field, field_validator, model_validator
+from services.cache import ArtifactCache, FileCache
+from services.jobs import FAILED, Job, JobQueue
+from services.scheduler import TrainingScheduler
+from services.storage import QuotaExceeded, StorageManager, touch_session
+from services.uploads import ChecksumMismatch, InvalidUpload, OffsetMismatch, TooManyUploads, UploadStore
 
 app = FastAPI()
 
@@ -17,6 +24,8 @@ GS_DIR.mkdir(parents=True, exist_ok=True)
 
 StateDict = TypedDict("StateDict", {
     "uuid": str,
+    # Last step whose results are in the session directory, read in place by the next step
+    "handoff": Optional[str],
 })
 
 # http://localhost:7860/file=/tmp/gradio/c2110a7de804b39754d229de426dc9307bc03aea/page.svelte
@@ -24,6 +33,47 @@ StateDict = TypedDict("StateDict", {
 HOST = "localhost"
 PORT = 7860
 
+# Number of ffmpeg processes decoding time segments of a video in parallel
+FFMPEG_SEGMENTS = max(1, (os.cpu_count() or 1) // 4)
+
+# Frames of step 1 shown in the UI, all of them stay in the session for step 2
+FRAME_PREVIEW_COUNT = 24
+
+# Trainer binary and number of GPUs (virtual devices) trainings are scheduled on
+GS_COMMAND = os.environ.get("GS_COMMAND", str(Path(__file__).parent.absolute() / "build" / "gaussian_splatting_cuda"))
+GS_DEVICES = int(os.environ.get("GS_DEVICES", "1"))
+GS_SLOTS_PER_DEVICE = int(os.environ.get("GS_SLOTS_PER_DEVICE", "1"))
+# Frame extraction and COLMAP jobs running at the same time
+GS_JOB_WORKERS = int(os.environ.get("GS_JOB_WORKERS", "4"))
+# Trainings get their own workers: waiting for a GPU slot never holds a worker of the other steps.
+# Twice the slots by default so the scheduler still picks the fairest of the waiting trainings.
+GS_TRAINING_WORKERS = int(os.environ.get("GS_TRAINING_WORKERS", 2 * GS_DEVICES * GS_SLOTS_PER_DEVICE))
+
+# Disk budget of the sessions and caches under GS_DIR, idle sessions are evicted beyond it
+GS_MAX_BYTES = int(float(os.environ.get("GS_MAX_BYTES", 50e9)))
+GS_MAX_SESSION_BYTES = int(float(os.environ.get("GS_MAX_SESSION_BYTES", 20e9)))
+GS_SESSION_TTL = float(os.environ.get("GS_SESSION_TTL", 24 * 3600))
+# Disk budget of the step results reused across sessions, and of the resized frames and image pyramids
+GS_CACHE_MAX_BYTES = int(float(os.environ.get("GS_CACHE_MAX_BYTES", 20e9)))
+GS_FRAME_CACHE_MAX_BYTES = int(float(os.environ.get("GS_FRAME_CACHE_MAX_BYTES", 5e9)))
+TRAINING_SCHEDULER = TrainingScheduler(GS_DEVICES, GS_SLOTS_PER_DEVICE)
+
+TILE_PATTERN = re.compile(r"index\.json|r[0-7]*\.splat")
+
+@app.get("/tiles/{session_id}/{file_name}")
+def get_tile(session_id: str, file_name: str, range_header: Optional[str] = Header(None, alias="Range")):
+    """Serve the tile index and the `.splat` tiles of a session, with HTTP range support."""
+    from services.utils.http_range import range_response
+    try:
+        session_id = str(uuid.UUID(session_id))
+    except ValueError:
+        raise HTTPException(status_code=404)
+    tile_path = GS_DIR / session_id / "output" / "tiles" / file_name
+    if not TILE_PATTERN.fullmatch(file_name) or not tile_path.is_file():
+        raise HTTPException(status_code=404)
+    media_type = "application/json" if file_name == "index.json" else "application/octet-stream"
+    return range_response(tile_path, range_header, media_type)
+
 home_markdown = """
 ...
 """
@@ -36,6 +86,9 @@ In the journey of transforming a video into a 3D Gaussian Splatting, the initial
 However, you can also do this step manually and upload the frames directory by yourself in the next step. In this case, you can skip this step and go directly to the next step.
 
 Please not that blurry frames will mostlikely result in a bad 3D model. So, make sure that the video is clear enough.
+With *Sharpness Oversampling* set to N, N candidate frames are extracted per kept frame and only the sharpest one of each group is kept.
+With a *Keyframe Budget*, frames are no longer taken at a fixed rate: the camera motion is analysed and up to that many keyframes are extracted, more during fast moves and fewer when the camera is still.
+In *Streaming* mode, frames are filtered as they are decoded: near-duplicates (within the *Duplicate Threshold*) are dropped and frames are downsized to the *Max Frame Size* before any of them is written.
 """
 
 step2_markdown = """
@@ -55,7 +108,7 @@ As it's quite rapid to train, you can easily use a high number of iterations.
 """
 
 def getPlyFile(session_state_value: StateDict) -> str:
-    return f"/tmp/gaussian_splatting_gradio/{session_state_value['uuid']}/output/final_point_cloud.ply"
+    return f"/tmp/gaussian_splatting_gradio/{session_state_value['uuid']}/output/final_point_cloud_pruned.ply"
 
 def getCamerasFile(session_state_value: StateDict) -> str:
     return f"/tmp/gaussian_splatting_gradio/{session_state_value['uuid']}/output/cameras.json"
@@ -81,10 +134,13 @@ def createStateSession(previous_session: StateDict) -> StateDict:
         print('Created temporary directory: ', session_tmpdirname)
         session = StateDict(
             uuid=session_uuid,
+            handoff=None,
         )
     else:
-        # Use previous session
+        # Use previous session, recreated if the storage janitor evicted it
         session = previous_session
+        (GS_DIR / str(session["uuid"])).mkdir(parents=True, exist_ok=True)
+    touch_session(GS_DIR / str(session["uuid"]))
     return session
 
 def removeStateSession(session_state_value: StateDict):
@@ -95,53 +151,474 @@ def removeStateSession(session_state_value: StateDict):
     shutil.rmtree(session_tmpdirname)
     return StateDict(
         uuid=None,
+        handoff=None,
     )
 
 def makeButtonVisible(btn_value: str) -> gr.Button:
     return gr.Button(btn_value, visible=True)
 
 
+# Session paths produced by each step, cached by the hash of the step inputs and parameters
+FFMPEG_OUTPUTS = ["input", "input_manifest.json"]
+COLMAP_OUTPUTS = [
+    "input", "input_manifest.json", "duplicates", "dropped_frames.json", "distorted", "sparse",
+    "images", "images_manifest.json", "images_2", "images_4", "images_8",
+]
+TRAINING_OUTPUTS = ["output", "training_metrics.json"]
+
+ARTIFACTS = ArtifactCache(GS_DIR / "cache" / "artifacts", GS_CACHE_MAX_BYTES)
+RESIZED_FRAMES = FileCache(GS_DIR / "cache" / "resized", GS_FRAME_CACHE_MAX_BYTES)
+PYRAMID_FRAMES = FileCache(GS_DIR / "cache" / "pyramid", GS_FRAME_CACHE_MAX_BYTES)
+
+#  Pipeline steps, run by the JOBS workers: they only take JSON parameters
+def runFfmpegStep(
+        session_id: str,
+        video_path: str,
+        fps: int,
+        qscale: int,
+        sharpness_oversample: int,
+        start_time: Optional[str],
+        end_time: Optional[str],
+        keyframe_budget: Optional[int],
+        streaming: bool,
+        dedup_threshold: Optional[int] = None,
+        max_size: Optional[int] = None,
+    ) -> dict:
+    session_path = GS_DIR / session_id
+    from services.cache import artifact_key
+    from services.ffmpeg import ffmpeg_run
+    from services.manifest import hash_file
+    key = artifact_key("ffmpeg", hash_file(Path(video_path)), {
+        "fps": fps,
+        "qscale": qscale,
+        "sharpness_oversample": sharpness_oversample,
+        "start_time": start_time,
+        "end_time": end_time,
+        "keyframe_budget": keyframe_budget,
+        "streaming": streaming,
+        "dedup_threshold": dedup_threshold,
+        "max_size": max_size,
+    })
+    with (session_path / "ffmpeg_log.txt").open("w") as log_file:
+        if ARTIFACTS.restore(key, session_path, FFMPEG_OUTPUTS):
+            log_file.write("Reused the frames of an identical previous extraction.\n")
+            return {"cached": True}
+        ARTIFACTS.detach(session_path, FFMPEG_OUTPUTS)
+        ffmpeg_run(
+            video_path = Path(video_path),
+            output_path = session_path,
+            fps = fps,
+            qscale = qscale,
+            sharpness_oversample = sharpness_oversample,
+            start_time = start_time,
+            end_time = end_time,
+            segments = FFMPEG_SEGMENTS,
+            keyframe_budget = keyframe_budget,
+            streaming = streaming,
+            dedup_threshold = dedup_threshold,
+            max_size = max_size,
+            # Rejected before decoding when the frames would not fit in the session quota
+            disk_budget = STORAGE.remaining_quota(session_id),
+            stream_file=log_file
+        )
+    ARTIFACTS.store(key, session_path, FFMPEG_OUTPUTS)
+    print("Done with ffmpeg")
+    return {"cached": False}
+
+def runColmapStep(
+        session_id: str,
+        camera: str,
+        max_image_size: Optional[int],
+        dedup_threshold: Optional[int],
+        enable_rerun: bool,
+    ) -> dict:
+    session_path = GS_DIR / session_id
+    rerunfile_path = session_path / "rerun_page.html"
+    from services.cache import artifact_key
+    from services.colmap import colmap
+    from services.manifest import FrameManifest
+    key = artifact_key("colmap", FrameManifest.load(session_path / "input").digest(), {
+        "camera": camera,
+        "max_image_size": max_image_size,
+        "dedup_threshold": dedup_threshold,
+    })
+    with (session_path / "colmap_log.txt").open("w") as log_file:
+        cached = ARTIFACTS.restore(key, session_path, COLMAP_OUTPUTS)
+        if cached:
+            log_file.write("Reused the reconstruction of an identical frame set.\n")
+        else:
+            ARTIFACTS.detach(session_path, COLMAP_OUTPUTS)
+            colmap(
+                source_path=session_path,
+                camera=camera,
+                dedup_threshold=dedup_threshold,
+                max_image_size=max_image_size,
+                resize_cache=RESIZED_FRAMES,
+                pyramid_cache=PYRAMID_FRAMES,
+                stream_file=log_file
+            )
+    if not cached:
+        ARTIFACTS.store(key, session_path, COLMAP_OUTPUTS)
+    print("Done with colmap")
+
+    if enable_rerun:
+        from services.rerun import read_and_log_sparse_reconstruction
+        html = read_and_log_sparse_reconstruction(
+            exp_name = session_id,
+            dataset_path = session_path,
+        )
+        print("Done with rerun")
+    else:
+        html = "Rerun was disable !"
+    with rerunfile_path.open("w") as rerunfile:
+        rerunfile.write(html)
+    return {"cached": cached}
+
+def trainingInputsDigest(session_path: Path) -> str:
+    """Digest of what the trainer reads: the undistorted images and the sparse model."""
+    from hashlib import blake2b
+    from services.manifest import FrameManifest, hash_file
+    digest = blake2b(digest_size=16)
+    digest.update(FrameManifest.load(session_path / "images").digest().encode())
+    for path in sorted((session_path / "sparse" / "0").glob("*.bin")):
+        digest.update(f"{path.name}:{hash_file(path)}\n".encode())
+    return digest.hexdigest()
+
+def trainGaussianSplatting(
+        session_path: Path,
+        iterations: int,
+        convergence_rate: float,
+        resolution: int,
+        sh_degree: int,
+        early_stop: bool,
+        run_key: str,
+    ):
+    session_id = session_path.name
+    from services.gaussian_splatting_cuda import gaussian_splatting_cuda
+    from services.frames import pyramid_factor, stage_pyramid_level
+    from services.manifest import FrameManifest
+
+    # Train on the smallest pyramid level that still covers the requested resolution
+    factor = pyramid_factor(FrameManifest.load(session_path / "images"), resolution)
+    data_path = session_path if factor == 1 else stage_pyramid_level(session_path, session_path / "train", factor)
+    with (session_path / "gaussian_splatting_cuda_log.txt").open("w") as log_file:
+        def report_position(position: int):
+            log_file.write(f"Waiting for a free GPU, {position} training(s) ahead in the queue\n")
+            log_file.flush()
+
+        # Wait for a GPU slot, runs beyond the device capacity are queued
+        with TRAINING_SCHEDULER.slot(session_id, on_wait=report_position) as device:
+            gaussian_splatting_cuda(
+                data_path = data_path,
+                output_path = session_path / "output",
+                gs_command = GS_COMMAND,
+                iterations = iterations,
+                convergence_rate = convergence_rate,
+                resolution = resolution,
+                enable_cr_monitoring = early_stop,
+                force = False,
+                empty_gpu_cache = False,
+                # Snapshots of an interrupted run are only resumed if its inputs and params match
+                resume = True,
+                run_key = run_key,
+                metrics_path = session_path / "training_metrics.json",
+                device = device,
+                stream_file = log_file
+            )
+    print("Done with gaussian_splatting_cuda")
+
+    # Build the viewer cameras straight from the COLMAP model
+    if (session_path / "sparse" / "0").exists():
+        from services.cameras import export_cameras, read_poses
+        poses = read_poses(session_path / "sparse" / "0")
+        export_cameras(session_path / "sparse" / "0", session_path / "output" / "cameras.json", "cameras", poses)
+        export_cameras(session_path / "sparse" / "0", session_path / "output" / "transforms.json", "transforms", poses)
+
+    # Prune invisible Gaussians, truncate the SH and export a compact .splat for the web viewer
+    from services.splat import export_splat, prune_gaussians
+    prune_gaussians(
+        session_path / "output" / "final_point_cloud.ply",
+        session_path / "output" / "final_point_cloud_pruned.ply",
+        sparse_path = session_path / "sparse" / "0" if (session_path / "sparse" / "0").exists() else None,
+        degree = sh_degree,
+    )
+    export_splat(session_path / "output" / "final_point_cloud_pruned.ply", session_path / "output" / "final.splat")
+
+    # Octree tiles with coarse-to-fine prefixes, served by /tiles for progressive loading
+    from services.tiling import build_tiles
+    build_tiles(session_path / "output" / "final_point_cloud_pruned.ply", session_path / "output" / "tiles")
+
+def runGaussianSplattingCudaStep(
+        session_id: str,
+        iterations: int,
+        convergence_rate: float,
+        resolution: int,
+        sh_degree: int,
+        early_stop: bool,
+    ) -> dict:
+    session_path = GS_DIR / session_id
+    from services.cache import artifact_key
+    key = artifact_key("gaussian_splatting_cuda", trainingInputsDigest(session_path), {
+        "iterations": iterations,
+        "convergence_rate": convergence_rate,
+        "resolution": resolution,
+        "sh_degree": sh_degree,
+        "early_stop": early_stop,
+    })
+    cached = ARTIFACTS.restore(key, session_path, TRAINING_OUTPUTS)
+    if cached:
+        with (session_path / "gaussian_splatting_cuda_log.txt").open("w") as log_file:
+            log_file.write("Reused the model of an identical previous training.\n")
+    else:
+        ARTIFACTS.detach(session_path, TRAINING_OUTPUTS)
+        trainGaussianSplatting(session_path, iterations, convergence_rate, resolution, sh_degree, early_stop, key)
+        ARTIFACTS.store(key, session_path, TRAINING_OUTPUTS)
+
+    # Create a zip of the session_path folder, inside the session so concurrent jobs don't collide
+    from services.archive import write_zip
+    archive = write_zip(session_path, session_path / "result.zip", exclude=isArchive)
+    print('Created zip file', archive)
+    return {"cached": cached}
+
+JOBS = JobQueue(GS_DIR / "jobs.sqlite3", workers=GS_JOB_WORKERS, pools={"training": GS_TRAINING_WORKERS})
+JOBS.register("ffmpeg", runFfmpegStep)
+JOBS.register("colmap", runColmapStep)
+JOBS.register("gaussian_splatting_cuda", runGaussianSplattingCudaStep, pool="training")
+
+STORAGE = StorageManager(
+    GS_DIR, GS_MAX_BYTES, GS_MAX_SESSION_BYTES, GS_SESSION_TTL,
+    is_busy=JOBS.is_active,
+    caches=[ARTIFACTS, RESIZED_FRAMES, PYRAMID_FRAMES],
+)
+
+@app.get("/storage")
+def get_storage() -> dict:
+    """Aggregate disk usage of the sessions, as of the last janitor pass, and of the caches."""
+    return {
+        **STORAGE.stats(),
+        "artifacts": ARTIFACTS.stats(),
+        "resized_frames": RESIZED_FRAMES.stats(),
+        "pyramid_frames": PYRAMID_FRAMES.stats(),
+    }
+
+@app.get("/jobs/{session_id}")
+def get_jobs(session_id: str) -> list:
+    """Status of every job of a session, oldest first."""
+    return JOBS.jobs_for(session_id)
+
+def isArchive(path: Path) -> bool:
+    # Previous results are never archived again
+    return path.suffix == ".zip"
+
+@app.get("/archive/{session_id}")
+def get_archive(session_id: str):
+    """Stream a zip of the whole session, built on the fly without a temporary file."""
+    from fastapi.responses import StreamingResponse
+    from services.archive import collect_entries, iter_zip
+    try:
+        session_id = str(uuid.UUID(session_id))
+    except ValueError:
+        raise HTTPException(status_code=404)
+    session_path = GS_DIR / session_id
+    if not session_path.is_dir():
+        raise HTTPException(status_code=404)
+    return StreamingResponse(
+        iter_zip(collect_entries(session_path, exclude=isArchive)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{session_id}.zip"'},
+    )
+
+class FfmpegParams(BaseModel):
+    """Extraction parameters of the ffmpeg job started by a completed upload (the step 1 defaults)."""
+    fps: int = Field(1, ge=1, le=60)
+    qscale: int = Field(1, ge=1, le=31)
+    sharpness_oversample: int = Field(1, ge=1, le=10)
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    keyframe_budget: Optional[int] = Field(None, ge=1)
+    streaming: bool = False
+    dedup_threshold: Optional[int] = Field(None, ge=0, le=64)
+    max_size: Optional[int] = Field(None, ge=16)
+
+    @field_validator("start_time", "end_time")
+    @classmethod
+    def check_time(cls, value: Optional[str]) -> Optional[str]:
+        from services.ffmpeg import FailedProcess, parse_time
+        if value is not None:
+            try:
+                parse_time(value)
+            except FailedProcess as e:
+                raise ValueError(str(e))
+        return value
+
+    @model_validator(mode="after")
+    def check_range(self) -> "FfmpegParams":
+        from services.ffmpeg import FailedProcess, parse_range
+        try:
+            parse_range(self.start_time, self.end_time)
+        except FailedProcess as e:
+            raise ValueError(str(e))
+        return self
+
+class UploadRequest(BaseModel):
+    filename: str
+    size: int = Field(gt=0)
+    session_id: Optional[str] = None
+    ffmpeg: FfmpegParams = Field(default_factory=FfmpegParams)
+
+UPLOADS = UploadStore(GS_DIR, max_size=GS_MAX_SESSION_BYTES)
+
+def uploadSessionId(session_id: str) -> str:
+    try:
+        return str(uuid.UUID(session_id))
+    except ValueError:
+        raise HTTPException(status_code=404)
+
+@app.post("/uploads")
+def create_upload(payload: UploadRequest) -> dict:
+    """
+    Start a resumable upload of `size` bytes into a session (a new one without
+    `session_id`). Optional `ffmpeg` parameters are used for the extraction
+    started once the upload is complete.
+    """
+    session_id = uploadSessionId(payload.session_id) if payload.session_id else str(uuid.uuid4())
+    session_path = GS_DIR / session_id
+    session_path.mkdir(parents=True, exist_ok=True)
+    touch_session(session_path)
+    try:
+        # The declared size is reserved up front, the sparse .part file does not show on disk yet
+        STORAGE.check_quota(session_id, UPLOADS.pending_bytes(session_id) + payload.size)
+        upload = UPLOADS.create(session_id, payload.filename, payload.size, payload.ffmpeg.model_dump())
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except TooManyUploads as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**upload, "chunk_size": UPLOADS.max_chunk_size}
+
+@app.get("/uploads/{session_id}/{upload_id}")
+def get_upload(session_id: str, upload_id: str) -> dict:
+    """State of an upload, `offset` is where the client resumes."""
+    upload = UPLOADS.get(uploadSessionId(session_id), uploadSessionId(upload_id))
+    if upload is None:
+        raise HTTPException(status_code=404)
+    return upload
+
+@app.put("/uploads/{session_id}/{upload_id}")
+async def put_upload_chunk(
+        session_id: str,
+        upload_id: str,
+        offset: int,
+        request: Request,
+        x_chunk_sha256: str = Header(...),
+    ):
+    """
+    Write the request body at `offset`. The offset only moves once the SHA-256
+    of the chunk matches `X-Chunk-SHA256`; on a 409 or 422 the client resumes
+    from the returned offset. The last chunk enqueues the ffmpeg extraction.
+    """
+    from fastapi.concurrency import run_in_threadpool
+    from fastapi.responses import JSONResponse
+    session_id = uploadSessionId(session_id)
+    upload = UPLOADS.get(session_id, uploadSessionId(upload_id))
+    if upload is None:
+        raise HTTPException(status_code=404)
+    touch_session(GS_DIR / session_id)
+    try:
+        # The session may have grown since the upload was created (frames, other steps)
+        STORAGE.check_quota(session_id, UPLOADS.pending_bytes(session_id))
+        with UPLOADS.open_chunk(upload, offset) as writer:
+            async for data in request.stream():
+                await run_in_threadpool(writer.write, data)
+            upload = await run_in_threadpool(writer.commit, x_chunk_sha256)
+    except OffsetMismatch as e:
+        return JSONResponse(status_code=409, content={"detail": str(e), "offset": e.offset})
+    except ChecksumMismatch as e:
+        return JSONResponse(status_code=422, content={"detail": str(e), "offset": upload["offset"]})
+    except InvalidUpload as e:
+        return JSONResponse(status_code=400, content={"detail": str(e), "offset": upload["offset"]})
+    except QuotaExceeded as e:
+        return JSONResponse(status_code=413, content={"detail": str(e), "offset": upload["offset"]})
+
+    if upload["path"] is None:
+        return upload
+    # Complete: the file is already in the session, ffmpeg starts on it right away
+    job_id = JOBS.enqueue(session_id, "ffmpeg", {"video_path": upload["path"], **upload["params"]})
+    return {**upload, "job_id": job_id}
+
+def runJob(session_state_value: StateDict, step: str, params: dict) -> Job:
+    """Enqueue a pipeline step for the session and wait for it, the handler only subscribes to the job.
+
+    Raises gr.Error when the step cannot run or fails, so that the `.success()` handoff is not set.
+    """
+    touch_session(GS_DIR / str(session_state_value["uuid"]))
+    try:
+        STORAGE.check_quota(str(session_state_value["uuid"]))
+    except QuotaExceeded as e:
+        print(f"Error - {e}")
+        raise gr.Error(str(e))
+    job_id = JOBS.enqueue(str(session_state_value["uuid"]), step, params)
+    job = JOBS.wait(job_id)
+    if job["status"] == FAILED:
+        print(f"Error - {job['error']}")
+        raise gr.Error(job["error"])
+    return job
+
 #  Process functions
 def process_ffmpeg(
         session_state_value: StateDict,
         ffmpeg_input: str,
         ffmpeg_fps: int,
         ffmpeg_qscale: int,
+        ffmpeg_sharpness_oversample: int,
+        ffmpeg_start_time: str,
+        ffmpeg_end_time: str,
+        ffmpeg_keyframe_budget: int,
+        ffmpeg_streaming: bool,
+        ffmpeg_dedup_threshold: int,
+        ffmpeg_max_size: int,
     ) -> list[str]:
     # Ensure that a session is active
     if session_state_value["uuid"] is None:
-        return
+        return []
 
     # Set up session directory
     session_path = GS_DIR / str(session_state_value['uuid'])
     logfile_path = Path(session_path) / "ffmpeg_log.txt"
     logfile_path.touch()
 
-    try:
-        from services.ffmpeg import ffmpeg_run
-        with logfile_path.open("w") as log_file:
-            ffmpeg_run(
-                video_path = Path(ffmpeg_input),
-                output_path = session_path,
-                fps = int(ffmpeg_fps),
-                qscale = int(ffmpeg_qscale),
-                stream_file=log_file
-            )
-        print("Done with ffmpeg")
-    except Exception as e:
-        print(f"Error - {e}")
-        # print('Error - Removing temporary directory', session_path)
-        # shutil.rmtree(session_path)
-    # Get the list of all the file of (session_path / "input")
-    list_of_jpgs = [str(f) for f in (session_path / "input").glob("*.jpg")]
-    return list_of_jpgs
+    # Keep the video in the session, the job must not depend on Gradio's temporary upload
+    from services.utils.files import link_or_copy
+    video_path = session_path / f"video{Path(ffmpeg_input).suffix}"
+    link_or_copy(Path(ffmpeg_input), video_path)
+
+    runJob(session_state_value, "ffmpeg", {
+        "video_path": str(video_path),
+        "fps": int(ffmpeg_fps),
+        "qscale": int(ffmpeg_qscale),
+        "sharpness_oversample": int(ffmpeg_sharpness_oversample),
+        "start_time": ffmpeg_start_time or None,
+        "end_time": ffmpeg_end_time or None,
+        "keyframe_budget": int(ffmpeg_keyframe_budget) if ffmpeg_keyframe_budget else None,
+        "streaming": bool(ffmpeg_streaming),
+        "dedup_threshold": int(ffmpeg_dedup_threshold) if ffmpeg_dedup_threshold else None,
+        "max_size": int(ffmpeg_max_size) if ffmpeg_max_size else None,
+    })
+    # Only a preview goes through Gradio, step 2 reads the frames from the session
+    from services.manifest import FrameManifest
+    paths = FrameManifest.load(session_path / "input").paths()
+    stride = max(1, -(-len(paths) // FRAME_PREVIEW_COUNT))
+    return [str(path) for path in paths[::stride]]
 
 def processColmap(
         session_state_value: StateDict,
         colmap_inputs: List[tempfile.NamedTemporaryFile],
         colmap_camera: str,
+        colmap_max_image_size: int,
+        colmap_dedup_threshold: int,
         enable_rerun: bool
-    ) -> Tuple[str, str]:
+    ) -> Tuple[List[str], str]:
     # Ensure that a session is active
     if session_state_value["uuid"] is None:
         return "", ""
@@ -154,41 +631,32 @@ def processColmap(
     rerunfile_path = Path(session_path) / "rerun_page.html"
     rerunfile_path.touch()
 
-    (session_path / "input").mkdir(parents=True, exist_ok=True)
-    for file in colmap_inputs:
-        print("copying", file.name, "to", session_path / "input")
-        shutil.copy(file.name, session_path / "input")
-
-    try:
-        from services.colmap import colmap
-        with logfile_path.open("w") as log_file:
-            colmap(
-                source_path=session_path,
-                camera=str(colmap_camera),
-                stream_file=log_file
-            )
-        print("Done with colmap")
-        
-        if enable_rerun:
-            from services.rerun import read_and_log_sparse_reconstruction
-            html = read_and_log_sparse_reconstruction(
-                exp_name = str(session_state_value['uuid']),
-                dataset_path = session_path,
-            )
-            print("Done with rerun")
-        else:
-            html = "Rerun was disable !"
-        with rerunfile_path.open("w") as rerunfile:
-            rerunfile.write(html)
-    except Exception as e:
-        print(f"Error - {e}")
-        # print('Error - Removing temporary directory', session_path)
-        # shutil.rmtree(session_path)
+    if colmap_inputs:
+        # Frames brought by the user replace those of step 1 instead of mixing with them.
+        # Removing the directory also drops the links shared with the cache, never written through
+        shutil.rmtree(session_path / "input", ignore_errors=True)
+        (session_path / "input").mkdir(parents=True)
+        for file in colmap_inputs:
+            print("copying", file.name, "to", session_path / "input")
+            shutil.copy(file.name, session_path / "input")
+    elif session_state_value.get("handoff") in ("ffmpeg", "colmap"):
+        # Handoff: the frames of step 1 are used in place
+        print("Using the frames of the session", session_path / "input", "from", session_state_value["handoff"])
+    else:
+        print("Error - No frames: run step 1 or upload frames first.")
+        raise gr.Error("No frames: run step 1 or upload frames first.")
+
+    runJob(session_state_value, "colmap", {
+        "camera": str(colmap_camera),
+        "max_image_size": int(colmap_max_image_size) if colmap_max_image_size else None,
+        "dedup_threshold": int(colmap_dedup_threshold) if colmap_dedup_threshold else None,
+        "enable_rerun": bool(enable_rerun),
+    })
 
-    # zip the session_path folder
-    archive = shutil.make_archive("result", 'zip', GS_DIR, session_path)
-    print('Created zip file', archive)
-    return archive, rerunfile_path
+    # Step 3 reads the session in place: only the sparse model is handed to the UI, the
+    # whole session can still be downloaded from /archive/{uuid}
+    sparse_files = sorted((session_path / "sparse" / "0").glob("*.bin"))
+    return [str(path) for path in sparse_files], rerunfile_path
 
 def processGaussianSplattingCuda(
         session_state_value: StateDict,
@@ -196,73 +664,98 @@ def processGaussianSplattingCuda(
         gs_iterations: int,
         gs_convergence_rate: float,
         gs_resolution: int,
-    ) -> Tuple[str, str]:
+        gs_sh_degree: int,
+        gs_early_stop: bool = False,
+    ) -> Tuple[str, str, str]:
     # Ensure that a session is active
     if session_state_value["uuid"] is None:
-        return
+        return None, None, None
     
     # Set up session directory
     session_path = GS_DIR / str(session_state_value['uuid'])
     logfile_path = Path(session_path) / "gaussian_splatting_cuda_log.txt"
     logfile_path.touch()
 
-    # Unzip the gs_input file to the session_path
-    shutil.unpack_archive(gs_input.name, session_path)
+    if gs_input is not None:
+        # Unzip the gs_input file (data brought by the user) to the session_path, after
+        # unlinking the files shared with the cache that the archive could overwrite
+        ARTIFACTS.detach(session_path, COLMAP_OUTPUTS + TRAINING_OUTPUTS)
+        shutil.unpack_archive(gs_input.name, session_path)
+    elif session_state_value.get("handoff") == "colmap":
+        # Handoff: the undistorted images and the sparse model of step 2 are used in place
+        print("Using the reconstruction of the session", session_path, "from", session_state_value["handoff"])
+    else:
+        print("Error - No reconstruction: run step 2 or upload a dataset first.")
+        raise gr.Error("No reconstruction: run step 2 or upload a dataset first.")
 
     # Copy the gs_input directory to the session_path
     # shutil.copytree(gs_input, session_path)
 
-    try:
-        from services.gaussian_splatting_cuda import gaussian_splatting_cuda
-        with logfile_path.open("w") as log_file:
-            gaussian_splatting_cuda(
-                data_path = session_path,
-                output_path = session_path / "output",
-                gs_command = str(Path(__file__).parent.absolute() / "build" / 'gaussian_splatting_cuda'),
-                iterations = int(gs_iterations),
-                convergence_rate = float(gs_convergence_rate),
-                resolution = int(gs_resolution),
-                enable_cr_monitoring = False,
-                force = False,
-                empty_gpu_cache = False,
-                stream_file = log_file
-            )
-        print("Done with gaussian_splatting_cuda")
-
-        # Create a zip of the session_path folder
-        archive = shutil.make_archive("result", 'zip', GS_DIR, session_path)
-        print('Created zip file', archive)
-
-        # Move the zip file to the session_path folder
-        shutil.move(archive, session_path)
-    except Exception as e:
-        print(f"Error - {e}")
-        # print('Error - Removing temporary directory', session_path)
-        # shutil.rmtree(session_path)
+    runJob(session_state_value, "gaussian_splatting_cuda", {
+        "iterations": int(gs_iterations),
+        "convergence_rate": float(gs_convergence_rate),
+        "resolution": int(gs_resolution),
+        "sh_degree": int(gs_sh_degree),
+        "early_stop": bool(gs_early_stop),
+    })
     
     return (
-        session_path / "output" / "final_point_cloud.ply",
+        session_path / "output" / "final_point_cloud_pruned.ply",
         session_path / "output" / "cameras.json",
+        session_path / "output" / "final.splat",
     )
 
 def updateLog(logname:str, session_state_value: StateDict) -> str:
     if session_state_value["uuid"] is None:
         return ""
 
-    log_file = GS_DIR / str(session_state_value['uuid']) / f"{logname}.txt"
-    if not log_file.exists():
-        return ""
-    
-    with log_file.open("r") as log_file:
-        logs = log_file.read()
+    # Only the trailing window is read, whatever the size of the log
+    from services.logs import read_tail
+    return read_tail(GS_DIR / str(session_state_value['uuid']) / f"{logname}.txt")
+
+LOG_NAMES = {"ffmpeg_log", "colmap_log", "gaussian_splatting_cuda_log"}
+
+@app.get("/logs/{session_id}/{logname}")
+def get_log_events(
+        session_id: str,
+        logname: str,
+        offset: int = 0,
+        last_event_id: Optional[str] = Header(None),
+    ):
+    """Push the new lines of a session log as server-sent events, resuming from Last-Event-ID."""
+    from fastapi.responses import StreamingResponse
+    from services.logs import iter_log_events
+    try:
+        session_id = str(uuid.UUID(session_id))
+    except ValueError:
+        raise HTTPException(status_code=404)
+    if logname not in LOG_NAMES:
+        raise HTTPException(status_code=404)
+    if last_event_id and last_event_id.isdigit():
+        offset = int(last_event_id)
+    return StreamingResponse(
+        iter_log_events(GS_DIR / session_id / f"{logname}.txt", max(0, offset)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    return logs
+def updateSnapshot(session_state_value: StateDict) -> Optional[str]:
+    if session_state_value["uuid"] is None:
+        return None
 
-def bindStep1Step2(step1_output: list[tempfile.NamedTemporaryFile]) -> list[str]:
-    return [file.name for file in step1_output]
+    snapshots = sorted(
+        (GS_DIR / str(session_state_value['uuid']) / "output" / "snapshots").glob("iteration_*.ply"),
+        key=lambda path: int(path.stem.split("_")[-1])
+    )
+    return str(snapshots[-1]) if snapshots else None
 
-def bindStep2Step3(step2_output: tempfile.NamedTemporaryFile) -> str:
-    return step2_output.name
+def bindStep1Step2(session_state_value: StateDict) -> StateDict:
+    # The frames stay in the session, step 2 consumes them by reference
+    return StateDict(uuid=session_state_value["uuid"], handoff="ffmpeg")
+
+def bindStep2Step3(session_state_value: StateDict) -> StateDict:
+    # The reconstruction stays in the session, step 3 consumes it by reference
+    return StateDict(uuid=session_state_value["uuid"], handoff="colmap")
 
 def makeRerunIframe(rerun_html : tempfile.NamedTemporaryFile) -> str:
     # If rerun_html is bigger than 300MB, then we don't show it
@@ -281,6 +774,7 @@ with gr.Blocks() as demo:
 
     session_state = gr.State({
         "uuid": None,
+        "handoff": None,
     })
 
     #############################
@@ -323,11 +817,60 @@ with gr.Blocks() as demo:
                         maximum=5,
                         step=1,
                     )
+                    # Video Frames - Inputs - Parameters - Sharpness Oversampling
+                    step1_sharpness_oversample = gr.Number(
+                        label="Sharpness Oversampling (1 to disable)",
+                        value=1,
+                        minimum=1,
+                        maximum=10,
+                        step=1,
+                    )
+                with gr.Row(variant="panel"):
+                    # Video Frames - Inputs - Parameters - Start Time
+                    step1_start_time = gr.Textbox(
+                        label="Start Time (e.g. 00:00:05)",
+                        placeholder="Beginning of the video",
+                    )
+                    # Video Frames - Inputs - Parameters - End Time
+                    step1_end_time = gr.Textbox(
+                        label="End Time (e.g. 00:01:30)",
+                        placeholder="End of the video",
+                    )
+                    # Video Frames - Inputs - Parameters - Keyframe Budget
+                    step1_keyframe_budget = gr.Number(
+                        label="Keyframe Budget (0 for fixed fps)",
+                        value=0,
+                        minimum=0,
+                        maximum=2_000,
+                        step=10,
+                    )
+                    # Video Frames - Inputs - Parameters - Streaming
+                    step1_streaming = gr.Checkbox(
+                        value=False,
+                        label="Streaming (only encode the selected frames)",
+                    )
+                with gr.Row(variant="panel"):
+                    # Video Frames - Inputs - Parameters - Duplicate Threshold
+                    step1_dedup_threshold = gr.Number(
+                        label="Duplicate Threshold in bits (streaming only, 0 to keep all frames)",
+                        value=0,
+                        minimum=0,
+                        maximum=16,
+                        step=1,
+                    )
+                    # Video Frames - Inputs - Parameters - Max Frame Size
+                    step1_max_size = gr.Number(
+                        label="Max Frame Size (0 to keep full size)",
+                        value=0,
+                        minimum=0,
+                        maximum=8192,
+                        step=100,
+                    )
             # Video Frames - Outputs
             with gr.Column():
                 # Video Frames - Outputs - Video File
                 step1_output = gr.File(
-                    label="Frames",
+                    label="Frames (preview)",
                     file_count="directory",
                     type="file",
                     interactive=False,
@@ -365,6 +908,22 @@ with gr.Blocks() as demo:
                         value="OPENCV",
                         choices=["OPENCV", "SIMPLE_PINHOLE", "PINHOLE", "SIMPLE_RADIAL", "RADIAL"],
                     )
+                    # Colmap - Inputs - Parameters - Max Image Size
+                    step2_max_image_size = gr.Number(
+                        label="Max Image Size (0 to keep full size)",
+                        value=1600,
+                        minimum=0,
+                        maximum=8192,
+                        step=100,
+                    )
+                    # Colmap - Inputs - Parameters - Duplicate Threshold
+                    step2_dedup_threshold = gr.Number(
+                        label="Duplicate Threshold in bits (0 to keep all frames)",
+                        value=4,
+                        minimum=0,
+                        maximum=16,
+                        step=1,
+                    )
                     # Colmap - Inputs - Parameters - Enable Rerun
                     step2_rerun = gr.Checkbox(
                         value=True,
@@ -374,9 +933,8 @@ with gr.Blocks() as demo:
             with gr.Column():
                 # Colmap - Outputs - Video File
                 step2_output = gr.File(
-                    label="Colmap",
-                    file_count="single",
-                    file_types=[".zip"],
+                    label="Colmap (sparse model)",
+                    file_count="multiple",
                     type="file",
                     interactive=False,
                 )
@@ -443,6 +1001,19 @@ with gr.Blocks() as demo:
                         maximum=1024,
                         step=128,
                     )
+                    # Gaussian Splatting - Inputs - Parameters - Output SH Degree
+                    step3_sh_degree = gr.Number(
+                        label="Output SH Degree",
+                        value=3,
+                        minimum=0,
+                        maximum=3,
+                        step=1,
+                    )
+                    # Gaussian Splatting - Inputs - Parameters - Early Stopping
+                    step3_early_stop = gr.Checkbox(
+                        value=False,
+                        label="Early Stopping (stop once the loss plateaus)",
+                    )
             # Gaussian Splatting - Outputs
             with gr.Column():
                 with gr.Row():
@@ -454,6 +1025,14 @@ with gr.Blocks() as demo:
                         interactive=False,
                     )
                 
+                    # Gaussian Splatting - Outputs - Splat File
+                    step3_output3 = gr.File(
+                        label="Splat File (web viewer)",
+                        file_count="single",
+                        type="file",
+                        interactive=False,
+                    )
+
                     # Gaussian Splatting - Outputs - Cameras File
                     step3_output2 = gr.File(
                         label="Cameras File",
@@ -461,6 +1040,13 @@ with gr.Blocks() as demo:
                         type="file",
                         interactive=False,
                     )
+                # Gaussian Splatting - Outputs - Latest Snapshot
+                step3_snapshot = gr.File(
+                    label="Latest Snapshot (updated during training)",
+                    file_count="single",
+                    type="file",
+                    interactive=False,
+                )
                 # Gaussian Splatting - Outputs - Logs
                 step3_logs = gr.Textbox(
                     label="Gaussian Splatting Logs",
@@ -491,12 +1077,12 @@ with gr.Blocks() as demo:
     # Do the processing when the process button is clicked
     step1_processevent = step1_processbtn.click(
         fn=process_ffmpeg,
-        inputs=[session_state, step1_input, step1_fps, step1_qscale],
+        inputs=[session_state, step1_input, step1_fps, step1_qscale, step1_sharpness_oversample, step1_start_time, step1_end_time, step1_keyframe_budget, step1_streaming, step1_dedup_threshold, step1_max_size],
         outputs=[step1_output],
     ).success(
         fn=bindStep1Step2,
-        inputs=[step1_output],
-        outputs=[step2_input],
+        inputs=[session_state],
+        outputs=[session_state],
     ).success(
         fn=makeButtonVisible,
         inputs=[step2_processbtn],
@@ -525,12 +1111,12 @@ with gr.Blocks() as demo:
     # Do the processing when the process button is clicked
     step2_processevent = step2_processbtn.click(
         fn=processColmap,
-        inputs=[session_state, step2_input, step2_camera, step2_rerun],
+        inputs=[session_state, step2_input, step2_camera, step2_max_image_size, step2_dedup_threshold, step2_rerun],
         outputs=[step2_output, step_2_visualize_html]
     ).success(
         fn=bindStep2Step3,
-        inputs=[step2_output],
-        outputs=[step3_input],
+        inputs=[session_state],
+        outputs=[session_state],
     ).success(
         fn=makeButtonVisible,
         inputs=[step3_processbtn],
@@ -563,8 +1149,8 @@ with gr.Blocks() as demo:
     # Do the processing when the process button is clicked
     step3_processevent = step3_processbtn.click(
         fn=processGaussianSplattingCuda,
-        inputs=[session_state, step3_input, step3_iterations, step3_convergence_rate, step3_resolution],
-        outputs=[step3_output1, step3_output2]
+        inputs=[session_state, step3_input, step3_iterations, step3_convergence_rate, step3_resolution, step3_sh_degree, step3_early_stop],
+        outputs=[step3_output1, step3_output2, step3_output3]
     )
     # .success(
     #     fn=lambda x: x,
@@ -578,6 +1164,13 @@ with gr.Blocks() as demo:
         outputs=[step3_logs],
         every=2,
     )
+    # Publish the intermediate snapshots as they appear
+    step3_snapshotevent = step3_processbtn.click(
+        fn=updateSnapshot,
+        inputs=[session_state],
+        outputs=[step3_snapshot],
+        every=5,
+    )
 
     # reset_button = gr.ClearButton(
     #     components=[video_input, text_log, ffmpeg_fps, ffmpeg_qscale, colmap_camera],
@@ -609,11 +1202,13 @@ with gr.Blocks() as demo:
 
 
 demo.queue()
-demo.launch()
+JOBS.start()
+STORAGE.start()
 
-# mount Gradio app to FastAPI app
-# app = gr.mount_gradio_app(app, demo, path="/")
+# mount Gradio app to FastAPI app, so the tile endpoints are served next to the UI
+app = gr.mount_gradio_app(app, demo, path="/")
 
 
-# if __name__ == "__main__":
-#     uvicorn.run(app, host="0.0.0.0", port=7860, ws_max_size=16777216*1000)
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=PORT, ws_max_size=16777216*1000)
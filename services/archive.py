@@ -0,0 +1,175 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+from pathlib import Path
+import struct
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+import zlib
+from rich.console import Console
+
+console = Console()
+
+# Already compressed formats are stored as-is, deflating them again only burns CPU
+STORED_SUFFIXES = {".jpg", ".jpeg", ".png", ".mp4", ".mov", ".mkv", ".webm", ".avi", ".zip", ".gz"}
+
+ZIP64_LIMIT = 0xFFFFFFFF
+STORED, DEFLATED = 0, 8
+# General purpose flags: sizes in a trailing data descriptor, UTF-8 names
+FLAGS = 0x0008 | 0x0800
+
+Entry = Tuple[Path, str]
+
+def collect_entries(root_path: Path, exclude: Optional[Callable[[Path], bool]] = None) -> List[Entry]:
+    """
+    List the regular files under `root_path` with their archive names relative
+    to it, sorted. Symlinks (training staging directories) are not followed.
+    """
+    entries = []
+    for directory, dirnames, filenames in os.walk(root_path):
+        dirnames[:] = sorted(name for name in dirnames if not os.path.islink(os.path.join(directory, name)))
+        for name in filenames:
+            path = Path(directory) / name
+            if path.is_symlink() or name.endswith(".tmp") or (exclude and exclude(path)):
+                continue
+            entries.append((path, path.relative_to(root_path).as_posix()))
+    return sorted(entries, key=lambda entry: entry[1])
+
+def _dos_time(mtime: float) -> Tuple[int, int]:
+    t = time.localtime(max(mtime, 315532800))  # zip can't represent dates before 1980
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+def _deflate_block(data: bytes, last: bool, level: int) -> bytes:
+    # Every block is a standalone raw deflate run ended by a sync flush, so the
+    # blocks concatenate into one valid stream (as pigz does)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+def _read_blocks(path: Path, block_size: int, limit: int) -> Iterator[Tuple[bytes, bool]]:
+    """Blocks of the first `limit` bytes of the file: bytes appended while it is read are left out."""
+    with path.open("rb") as fid:
+        block = fid.read(min(block_size, limit))
+        remaining = limit - len(block)
+        while True:
+            following = fid.read(min(block_size, remaining)) if remaining > 0 else b""
+            remaining -= len(following)
+            yield block, not following
+            if not following:
+                return
+            block = following
+
+def iter_zip(
+        entries: Iterable[Entry],
+        workers: Optional[int] = None,
+        block_size: int = 1 << 20,
+        level: int = 6
+    ) -> Iterator[bytes]:
+    """
+    Yield the bytes of a zip archive of `entries`, in order and without ever
+    seeking, so it can be written to a file or streamed to a client as is.
+
+    Media listed in `STORED_SUFFIXES` are stored; the other files are deflated
+    by blocks of `block_size` on `workers` threads (zlib releases the GIL).
+    Sizes and CRCs follow each entry in a data descriptor and ZIP64 records
+    are used for entries, offsets and counts beyond the classic zip limits.
+    """
+    workers = workers or min(8, os.cpu_count() or 1)
+    central = []
+    offset = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, name in entries:
+            stat = path.stat()
+            # Files still being written (logs) are archived as they were when listed
+            limit = stat.st_size
+            method = STORED if path.suffix.lower() in STORED_SUFFIXES else DEFLATED
+            # Deflate never grows a block by more than a few bytes, keep a margin for that
+            zip64 = limit + (limit >> 8) + 1024 > ZIP64_LIMIT
+            dos_time, dos_date = _dos_time(stat.st_mtime)
+            encoded = name.encode("utf-8")
+            extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0) if zip64 else b""
+            header = struct.pack(
+                "<IHHHHHIIIHH", 0x04034B50, 45 if zip64 else 20, FLAGS, method, dos_time, dos_date,
+                0, ZIP64_LIMIT if zip64 else 0, ZIP64_LIMIT if zip64 else 0, len(encoded), len(extra),
+            ) + encoded + extra
+            header_offset = offset
+            yield header
+            offset += len(header)
+
+            crc, compressed_size, size = 0, 0, 0
+            if method == STORED:
+                for block, _ in _read_blocks(path, block_size, limit):
+                    crc = zlib.crc32(block, crc)
+                    size += len(block)
+                    compressed_size += len(block)
+                    yield block
+            else:
+                # Keep a bounded window of blocks in flight, written back in order
+                pending = deque()
+                for block, last in _read_blocks(path, block_size, limit):
+                    crc = zlib.crc32(block, crc)
+                    size += len(block)
+                    pending.append(executor.submit(_deflate_block, block, last, level))
+                    while len(pending) > 2 * workers:
+                        data = pending.popleft().result()
+                        compressed_size += len(data)
+                        yield data
+                while pending:
+                    data = pending.popleft().result()
+                    compressed_size += len(data)
+                    yield data
+            offset += compressed_size
+
+            # The size read and hashed, the file may have shrunk since it was listed
+            descriptor = (
+                struct.pack("<IIQQ", 0x08074B50, crc, compressed_size, size) if zip64
+                else struct.pack("<IIII", 0x08074B50, crc, compressed_size, size)
+            )
+            yield descriptor
+            offset += len(descriptor)
+            central.append((encoded, method, dos_time, dos_date, crc, compressed_size, size, header_offset, zip64))
+
+    yield from _central_directory(central, offset)
+
+def _central_directory(central: list, offset: int) -> Iterator[bytes]:
+    directory_offset = offset
+    directory_size = 0
+    for encoded, method, dos_time, dos_date, crc, compressed_size, size, header_offset, zip64 in central:
+        values = [value for value in (size, compressed_size, header_offset) if value >= ZIP64_LIMIT]
+        extra = struct.pack("<HH", 0x0001, 8 * len(values)) + struct.pack(f"<{len(values)}Q", *values) if values else b""
+        record = struct.pack(
+            "<IHHHHHHIIIHHHHHII", 0x02014B50, 45, 45 if (zip64 or values) else 20, FLAGS, method,
+            dos_time, dos_date, crc,
+            min(compressed_size, ZIP64_LIMIT), min(size, ZIP64_LIMIT),
+            len(encoded), len(extra), 0, 0, 0, 0o100644 << 16, min(header_offset, ZIP64_LIMIT),
+        ) + encoded + extra
+        directory_size += len(record)
+        yield record
+
+    count = len(central)
+    if count >= 0xFFFF or directory_offset >= ZIP64_LIMIT or directory_size >= ZIP64_LIMIT:
+        zip64_end_offset = directory_offset + directory_size
+        yield struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, directory_size, directory_offset)
+        yield struct.pack("<IIQI", 0x07064B50, 0, zip64_end_offset, 1)
+    yield struct.pack(
+        "<IHHHHIIH", 0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+        min(directory_size, ZIP64_LIMIT), min(directory_offset, ZIP64_LIMIT), 0,
+    )
+
+def write_zip(
+        root_path: Path,
+        archive_path: Path,
+        exclude: Optional[Callable[[Path], bool]] = None,
+        workers: Optional[int] = None
+    ) -> Path:
+    """Archive the content of `root_path` into `archive_path`, written under a temporary name then renamed."""
+    archive_path.parent.mkdir(parents=True, exist_ok=True)
+    entries = collect_entries(root_path, exclude)
+    # The archive itself may live inside root_path
+    entries = [entry for entry in entries if entry[0] != archive_path]
+    tmp_path = archive_path.with_name(f".{archive_path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("wb") as fid:
+        for chunk in iter_zip(entries, workers):
+            fid.write(chunk)
+    tmp_path.replace(archive_path)
+    console.log(f"📦 Archived {len(entries)} files into {archive_path}")
+    return archive_path
@@ -0,0 +1,219 @@
+from hashlib import blake2b
+import json
+import os
+from pathlib import Path
+import shutil
+import threading
+import time
+from typing import Iterable, List, Optional
+import uuid
+from rich.console import Console
+from services.utils.files import link_or_copy
+
+console = Console()
+
+ENTRY_FILE = "entry.json"
+
+def artifact_key(step: str, inputs: str, params: dict) -> str:
+    """Key of a step output: its name, the digest of its inputs and its parameters."""
+    digest = blake2b(digest_size=16)
+    digest.update(json.dumps({"step": step, "inputs": inputs, "params": params}, sort_keys=True).encode())
+    return f"{step}-{digest.hexdigest()}"
+
+def _link_tree(src: Path, dst: Path) -> int:
+    """Hard link every regular file of `src` into `dst`, return the bytes linked. Symlinks are skipped."""
+    if src.is_file():
+        link_or_copy(src, dst)
+        return src.stat().st_size
+    total = 0
+    dst.mkdir(parents=True, exist_ok=True)
+    with os.scandir(src) as entries:
+        for entry in entries:
+            if entry.is_symlink():
+                continue
+            total += _link_tree(Path(entry.path), dst / entry.name)
+    return total
+
+def _remove(path: Path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    elif path.exists() or path.is_symlink():
+        path.unlink()
+
+def _unshare(path: Path):
+    """Replace a hard linked file by a private copy, written under a temporary name then renamed."""
+    if path.is_symlink() or path.stat().st_nlink <= 1:
+        return
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    shutil.copy2(path, tmp_path)
+    tmp_path.replace(path)
+
+class ArtifactCache:
+    """
+    Content-addressed store of pipeline step outputs, bounded to `max_bytes`.
+
+    An entry holds hard links to the files a step produced in its session,
+    under a key built by `artifact_key`: a later run with the same inputs and
+    parameters links them back instead of recomputing. Entries are published
+    with an atomic rename and evicted least recently used first.
+    """
+
+    def __init__(self, root_path: Path, max_bytes: int):
+        self.root_path = root_path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        root_path.mkdir(parents=True, exist_ok=True)
+
+    def lookup(self, key: str) -> Optional[Path]:
+        entry_path = self.root_path / key
+        if not (entry_path / ENTRY_FILE).exists():
+            return None
+        # The entry file mtime is the last use, for the LRU eviction
+        (entry_path / ENTRY_FILE).touch()
+        return entry_path
+
+    def restore(self, key: str, session_path: Path, outputs: Iterable[str]) -> bool:
+        """Link the cached outputs of `key` into the session, replacing what is there. Return False on a miss."""
+        entry_path = self.lookup(key)
+        if entry_path is None:
+            return False
+        stored = json.loads((entry_path / ENTRY_FILE).read_text())["outputs"]
+        for name in outputs:
+            _remove(session_path / name)
+            if name in stored:
+                _link_tree(entry_path / "data" / name, session_path / name)
+        console.log(f"♻️  Reused cached {key}")
+        return True
+
+    def detach(self, session_path: Path, outputs: Iterable[str]):
+        """
+        Give the session its own copy of the outputs still linked to the cache,
+        so that a tool rewriting them in place can't corrupt a cache entry. The
+        files stay in place: a step may read them as its inputs.
+        """
+        for name in outputs:
+            path = session_path / name
+            if path.is_dir() and not path.is_symlink():
+                for directory, _, filenames in os.walk(path):
+                    for filename in filenames:
+                        _unshare(Path(directory) / filename)
+            elif path.is_file():
+                _unshare(path)
+
+    def store(self, key: str, session_path: Path, outputs: Iterable[str]) -> Optional[Path]:
+        entry_path = self.root_path / key
+        if (entry_path / ENTRY_FILE).exists():
+            return entry_path
+        tmp_path = self.root_path / f".{key}.{uuid.uuid4().hex}.tmp"
+        stored: List[str] = []
+        size = 0
+        try:
+            for name in outputs:
+                if (session_path / name).exists():
+                    size += _link_tree(session_path / name, tmp_path / "data" / name)
+                    stored.append(name)
+            tmp_path.mkdir(parents=True, exist_ok=True)
+            (tmp_path / ENTRY_FILE).write_text(json.dumps({"key": key, "outputs": stored, "bytes": size, "created_at": time.time()}))
+            tmp_path.rename(entry_path)
+        except OSError:
+            # Another session stored the same key first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return self.lookup(key)
+        console.log(f"💾 Cached {key} ({size / 1e6:.0f} MB)")
+        self.evict()
+        return entry_path
+
+    def entries(self) -> List[dict]:
+        entries = []
+        for entry_path in self.root_path.iterdir():
+            try:
+                entry = json.loads((entry_path / ENTRY_FILE).read_text())
+                entry["last_used"] = (entry_path / ENTRY_FILE).stat().st_mtime
+            except (OSError, ValueError):
+                continue
+            entries.append(entry)
+        return entries
+
+    def evict(self) -> List[str]:
+        """Remove the least recently used entries until the cache fits in `max_bytes`."""
+        with self.lock:
+            entries = sorted(self.entries(), key=lambda entry: entry["last_used"])
+            total = sum(entry["bytes"] for entry in entries)
+            evicted = []
+            for entry in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(self.root_path / entry["key"], ignore_errors=True)
+                total -= entry["bytes"]
+                evicted.append(entry["key"])
+        if evicted:
+            console.log(f"🧹 Evicted {len(evicted)} cached artifacts")
+        return evicted
+
+    def stats(self) -> dict:
+        entries = self.entries()
+        return {"entries": len(entries), "bytes": sum(entry["bytes"] for entry in entries), "max_bytes": self.max_bytes}
+
+class FileCache:
+    """
+    Flat directory of derived files (resized frames, pyramid levels) keyed by
+    name, bounded to `max_bytes` (unbounded when None).
+
+    A hit refreshes the file mtime, which orders the least recently used
+    eviction. Files are hard linked into the sessions: evicting one never
+    affects the sessions using it.
+    """
+
+    def __init__(self, root_path: Path, max_bytes: Optional[int] = None):
+        self.root_path = root_path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        root_path.mkdir(parents=True, exist_ok=True)
+
+    def path(self, name: str) -> Path:
+        return self.root_path / name
+
+    def lookup(self, name: str) -> Optional[Path]:
+        path = self.path(name)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def files(self) -> List[os.DirEntry]:
+        with os.scandir(self.root_path) as entries:
+            return [entry for entry in entries if entry.is_file() and not entry.name.endswith(".tmp")]
+
+    def evict(self) -> int:
+        """Remove the least recently used files until the cache fits in `max_bytes`, return how many."""
+        if self.max_bytes is None:
+            return 0
+        with self.lock:
+            files = []
+            for entry in self.files():
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            evicted = 0
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                Path(path).unlink(missing_ok=True)
+                total -= size
+                evicted += 1
+        if evicted:
+            console.log(f"🧹 Evicted {evicted} cached files from {self.root_path}")
+        return evicted
+
+    def stats(self) -> dict:
+        sizes = []
+        for entry in self.files():
+            try:
+                sizes.append(entry.stat().st_size)
+            except FileNotFoundError:
+                continue
+        return {"files": len(sizes), "bytes": sum(sizes), "max_bytes": self.max_bytes}
@@ -0,0 +1,149 @@
+import json
+from pathlib import Path
+import struct
+from typing import Iterator, Optional
+import numpy as np
+from rich.console import Console
+
+console = Console()
+
+# Models whose parameters start with a single focal length, the others start with fx, fy
+SINGLE_FOCAL_MODELS = {"SIMPLE_PINHOLE", "SIMPLE_RADIAL", "RADIAL", "SIMPLE_RADIAL_FISHEYE", "RADIAL_FISHEYE"}
+
+# Bytes of an (x, y, point3D_id) entry of images.bin, skipped without being parsed
+POINT2D_BYTES = 24
+
+def read_poses(sparse_path: Path) -> dict:
+    """
+    Read the poses of a COLMAP binary model as arrays: image ids (M,), names,
+    camera ids (M,), quaternions (M, 4) and translations (M, 3), sorted by name.
+
+    Unlike `read_images_binary`, the 2D keypoints of every image are skipped
+    with a seek instead of being decoded.
+    """
+    ids, names, camera_ids, poses = [], [], [], []
+    with (sparse_path / "images.bin").open("rb") as fid:
+        num_images = struct.unpack("<Q", fid.read(8))[0]
+        for _ in range(num_images):
+            image_id, *pose, camera_id = struct.unpack("<I7dI", fid.read(64))
+            name = bytearray()
+            while (char := fid.read(1)) != b"\x00":
+                name += char
+            num_points2D = struct.unpack("<Q", fid.read(8))[0]
+            fid.seek(num_points2D * POINT2D_BYTES, 1)
+            ids.append(image_id)
+            names.append(name.decode())
+            camera_ids.append(camera_id)
+            poses.append(pose)
+
+    order = sorted(range(len(names)), key=names.__getitem__)
+    poses = np.asarray(poses, dtype=np.float64).reshape(-1, 7)[order]
+    return {
+        "ids": np.asarray(ids, dtype=np.int64)[order],
+        "names": [names[i] for i in order],
+        "camera_ids": np.asarray(camera_ids, dtype=np.int64)[order],
+        "qvecs": poses[:, :4],
+        "tvecs": poses[:, 4:],
+    }
+
+def qvecs_to_rotmats(qvecs: np.ndarray) -> np.ndarray:
+    """Batched `qvec2rotmat`: (M, 4) w, x, y, z quaternions to (M, 3, 3) rotations."""
+    qvecs = qvecs / np.linalg.norm(qvecs, axis=1, keepdims=True)
+    w, x, y, z = qvecs.T
+    return np.stack([
+        1 - 2 * y**2 - 2 * z**2, 2 * x * y - 2 * w * z, 2 * z * x + 2 * w * y,
+        2 * x * y + 2 * w * z, 1 - 2 * x**2 - 2 * z**2, 2 * y * z - 2 * w * x,
+        2 * z * x - 2 * w * y, 2 * y * z + 2 * w * x, 1 - 2 * x**2 - 2 * y**2,
+    ], axis=1).reshape(-1, 3, 3)
+
+def camera_to_world(qvecs: np.ndarray, tvecs: np.ndarray) -> np.ndarray:
+    """(M, 4, 4) camera to world matrices from COLMAP world to camera poses."""
+    rotations = qvecs_to_rotmats(qvecs).transpose(0, 2, 1)
+    c2w = np.zeros((len(qvecs), 4, 4))
+    c2w[:, :3, :3] = rotations
+    c2w[:, :3, 3] = -np.einsum("mij,mj->mi", rotations, tvecs)
+    c2w[:, 3, 3] = 1
+    return c2w
+
+def read_intrinsics(sparse_path: Path, camera_ids: np.ndarray) -> dict:
+    """Per image pinhole intrinsics fx, fy, cx, cy (M,) and sizes width, height (M,)."""
+    from services.utils.read_write_model import read_cameras_binary
+    cameras = read_cameras_binary(sparse_path / "cameras.bin")
+    table = {}
+    for camera_id, camera in cameras.items():
+        params = camera.params
+        if camera.model in SINGLE_FOCAL_MODELS:
+            table[camera_id] = (params[0], params[0], params[1], params[2], camera.width, camera.height)
+        else:
+            table[camera_id] = (*params[:4], camera.width, camera.height)
+    # Few distinct cameras: look them up once and gather per image
+    unique, inverse = np.unique(camera_ids, return_inverse=True)
+    values = np.asarray([table[camera_id] for camera_id in unique.tolist()], dtype=np.float64).reshape(-1, 6)[inverse]
+    fx, fy, cx, cy, width, height = values.T
+    return {"fx": fx, "fy": fy, "cx": cx, "cy": cy, "width": width.astype(np.int64), "height": height.astype(np.int64)}
+
+def iter_cameras_json(poses: dict, intrinsics: dict) -> Iterator[str]:
+    """Stream the `cameras.json` of the Gaussian Splatting viewers, one camera per line."""
+    c2w = camera_to_world(poses["qvecs"], poses["tvecs"])
+    positions = c2w[:, :3, 3].tolist()
+    rotations = c2w[:, :3, :3].tolist()
+    fx, fy = intrinsics["fx"].tolist(), intrinsics["fy"].tolist()
+    width, height = intrinsics["width"].tolist(), intrinsics["height"].tolist()
+    yield "["
+    for i, name in enumerate(poses["names"]):
+        yield ("," if i else "") + "\n" + json.dumps({
+            "id": i,
+            "img_name": Path(name).stem,
+            "width": width[i],
+            "height": height[i],
+            "position": positions[i],
+            "rotation": rotations[i],
+            "fy": fy[i],
+            "fx": fx[i],
+        })
+    yield "\n]\n"
+
+def iter_transforms_json(poses: dict, intrinsics: dict, images_dir: str = "images") -> Iterator[str]:
+    """
+    Stream a NeRF style `transforms.json` (instant-ngp, nerfstudio): camera to
+    world matrices in the OpenGL convention (y up, looking down -z).
+    """
+    c2w = camera_to_world(poses["qvecs"], poses["tvecs"])
+    c2w[:, :3, 1:3] *= -1
+    matrices = c2w.tolist()
+    columns = {key: intrinsics[key].tolist() for key in ("fx", "fy", "cx", "cy", "width", "height")}
+    yield '{\n"camera_model": "PINHOLE",\n"frames": ['
+    for i, name in enumerate(poses["names"]):
+        yield ("," if i else "") + "\n" + json.dumps({
+            "file_path": f"{images_dir}/{name}",
+            "transform_matrix": matrices[i],
+            "fl_x": columns["fx"][i],
+            "fl_y": columns["fy"][i],
+            "cx": columns["cx"][i],
+            "cy": columns["cy"][i],
+            "w": columns["width"][i],
+            "h": columns["height"][i],
+        })
+    yield "\n]\n}\n"
+
+CAMERA_FORMATS = {
+    "cameras": iter_cameras_json,
+    "transforms": iter_transforms_json,
+}
+
+def export_cameras(sparse_path: Path, output_path: Path, format: str = "cameras", poses: Optional[dict] = None) -> Path:
+    """
+    Write the cameras of the COLMAP model in `sparse_path` to `output_path` in
+    one of the `CAMERA_FORMATS`, without going through the trainer.
+    """
+    if format not in CAMERA_FORMATS:
+        raise ValueError(f"Unknown camera format {format}, expected one of {list(CAMERA_FORMATS)}")
+    poses = poses if poses is not None else read_poses(sparse_path)
+    intrinsics = read_intrinsics(sparse_path, poses["camera_ids"])
+    tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+    with tmp_path.open("w") as fid:
+        for chunk in CAMERA_FORMATS[format](poses, intrinsics):
+            fid.write(chunk)
+    tmp_path.replace(output_path)
+    console.log(f"📷 Exported {len(poses['names'])} cameras to {output_path}")
+    return output_path
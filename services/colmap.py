@@ -1,11 +1,15 @@
-from typing import Literal, Optional
+from typing import Literal, Optional, Tuple
 from io import IOBase
+import json
 import os
 from pathlib import Path
 import shutil
+import struct
 import subprocess
 from rich.progress import Progress
 from rich.console import Console
+from services.cache import FileCache
+from services.manifest import FrameManifest
 
 console = Console()
 
@@ -18,9 +22,11 @@ def colmap_feature_extraction(
         camera: Literal["OPENCV"], 
         colmap_command: str = "colmap", 
         use_gpu: bool = True,
+        manifest: Optional[FrameManifest] = None,
         stream_file: Optional[IOBase] = None
     ):
-    total = len(list(image_path.glob("*.jpg")))
+    manifest = manifest if manifest is not None else FrameManifest.load(image_path)
+    total = len(manifest)
     with Progress(console=console) as progress:
         task = progress.add_task("Feature Extraction", total=total)
 
@@ -66,9 +72,11 @@ def colmap_feature_matching(
         image_path: Path,
         colmap_command: str = "colmap",
         use_gpu: bool = True,
+        manifest: Optional[FrameManifest] = None,
         stream_file: Optional[IOBase] = None
     ):
-    total = len(list(image_path.glob("*.jpg")))
+    manifest = manifest if manifest is not None else FrameManifest.load(image_path)
+    total = len(manifest)
     with Progress(console=console) as progress:
         task = progress.add_task("Feature Matching", total=total)
 
@@ -102,9 +110,11 @@ def colmap_bundle_adjustment(
         image_path: Path,
         sparse_path: Path,
         colmap_command: str = "colmap",
+        manifest: Optional[FrameManifest] = None,
         stream_file: Optional[IOBase] = None
     ):
-    total = len(list(image_path.glob("*.jpg")))
+    manifest = manifest if manifest is not None else FrameManifest.load(image_path)
+    total = len(manifest)
     with Progress(console=console) as progress:
         task = progress.add_task("Bundle Adjustment", total=total)
 
@@ -146,14 +156,183 @@ def colmap_bundle_adjustment(
     else:
         raise FailedProcess("Bundle adjustment failed.")
 
+def colmap_hierarchical_mapper(
+        database_path: Path,
+        image_path: Path,
+        sparse_path: Path,
+        colmap_command: str = "colmap",
+        leaf_max_num_images: int = 500,
+        image_overlap: int = 50,
+        num_workers: int = -1,
+        manifest: Optional[FrameManifest] = None,
+        stream_file: Optional[IOBase] = None
+    ):
+    """
+    Partitioned alternative to `colmap_bundle_adjustment` for large frame sets.
+
+    The match graph is split into overlapping clusters of at most
+    `leaf_max_num_images` images, each cluster is mapped by its own worker
+    (`num_workers=-1` uses every core) and the sub-models are merged back.
+    Clusters that could not be merged are left as extra models in `sparse_path`,
+    use `colmap_model_merger` to fold them into `sparse_path / "0"`.
+    """
+    manifest = manifest if manifest is not None else FrameManifest.load(image_path)
+    total = len(manifest)
+    with Progress(console=console) as progress:
+        task = progress.add_task("Hierarchical Mapping", total=total)
+
+        cmd = [
+            colmap_command,
+            "hierarchical_mapper",
+            "--database_path", database_path.as_posix(),
+            "--image_path", image_path.as_posix(),
+            "--output_path", sparse_path.as_posix(),
+            "--leaf_max_num_images", str(leaf_max_num_images),
+            "--image_overlap", str(image_overlap),
+            "--num_workers", str(num_workers),
+            "--Mapper.ba_global_function_tolerance=0.000001"
+        ]
+        console.log(f"💻 Executing command: {' '.join(cmd)}")
+
+        sparse_path.mkdir(parents=True, exist_ok=True)
+
+        _stdout = stream_file if stream_file else subprocess.PIPE
+        registered = 0
+        with subprocess.Popen(cmd, stdout=_stdout, stderr=subprocess.STDOUT, text=True) as process:
+            if process.stdout:
+                for line in process.stdout:
+                    # Clusters are mapped concurrently, so count registrations
+                    # instead of trusting the per-cluster image index.
+                    if line.startswith("Registering image #"):
+                        registered += 1
+                        progress.update(task, completed=min(registered, total), refresh=True)
+
+        progress.update(task, completed=int(total), refresh=True)
+
+    return_code = process.returncode
+
+    if return_code == 0:
+        console.log('✅ Hierarchical mapping completed.')
+    else:
+        raise FailedProcess("Hierarchical mapping failed.")
+
+def _count_registered_images(model_path: Path) -> int:
+    # images.bin starts with the number of registered images as an uint64
+    with (model_path / "images.bin").open("rb") as fid:
+        return struct.unpack("<Q", fid.read(8))[0]
+
+def colmap_model_merger(
+        sparse_path: Path,
+        colmap_command: str = "colmap",
+        stream_file: Optional[IOBase] = None
+    ) -> Path:
+    """
+    Merge every sub-model found in `sparse_path` into `sparse_path / "0"`.
+
+    Sub-models are merged largest first. Models that share no images with the
+    merged result cannot be merged and are moved to `sparse_path / "unmerged"`
+    so that `sparse/0` stays the single model used by the next stages.
+    """
+    models = [path for path in sparse_path.iterdir() if path.is_dir() and path.name.isdigit()]
+    models.sort(key=_count_registered_images, reverse=True)
+    if len(models) <= 1:
+        return sparse_path / "0"
+
+    console.log(f"🧩 Merging {len(models)} sub-models from {sparse_path}")
+    merged_path = sparse_path / "merged"
+    shutil.rmtree(merged_path, ignore_errors=True)
+    shutil.copytree(models[0], merged_path)
+    unmerged_path = sparse_path / "unmerged"
+
+    for model in models[1:]:
+        output_path = sparse_path / "merging"
+        shutil.rmtree(output_path, ignore_errors=True)
+        output_path.mkdir()
+        cmd = [
+            colmap_command,
+            "model_merger",
+            "--input_path1", merged_path.as_posix(),
+            "--input_path2", model.as_posix(),
+            "--output_path", output_path.as_posix(),
+        ]
+        console.log(f"💻 Executing command: {' '.join(cmd)}")
+
+        _stdout = stream_file if stream_file else subprocess.PIPE
+        with subprocess.Popen(cmd, stdout=_stdout, stderr=subprocess.STDOUT, text=True) as process:
+            if process.stdout:
+                for line in process.stdout:
+                    pass
+
+        if process.returncode == 0 and (output_path / "images.bin").exists():
+            shutil.rmtree(merged_path)
+            output_path.rename(merged_path)
+        else:
+            console.log(f"⚠️ Could not merge sub-model {model.name}, keeping it in {unmerged_path}")
+            shutil.rmtree(output_path, ignore_errors=True)
+            unmerged_path.mkdir(exist_ok=True)
+            shutil.move(model.as_posix(), (unmerged_path / model.name).as_posix())
+
+    for model in models:
+        if model.exists():
+            shutil.rmtree(model)
+    merged_path.rename(sparse_path / "0")
+    console.log('✅ Model merging completed.')
+    return sparse_path / "0"
+
+def check_sparse_model(
+        sparse0_path: Path,
+        image_path: Path,
+        min_registered_ratio: float = 0.5,
+        manifest: Optional[FrameManifest] = None
+    ) -> int:
+    """
+    Sanity check the model in `sparse0_path` before it is undistorted.
+
+    Raise `FailedProcess` if the model is missing, empty or references images
+    that are not in `image_path`, and warn when fewer than
+    `min_registered_ratio` of the input frames got registered.
+    Return the number of registered images.
+    """
+    from services.utils.read_write_model import read_cameras_binary, read_images_binary
+
+    for name in ["cameras.bin", "images.bin", "points3D.bin"]:
+        if not (sparse0_path / name).exists():
+            raise FailedProcess(f"Sparse model is incomplete, {sparse0_path / name} is missing.")
+
+    cameras = read_cameras_binary(sparse0_path / "cameras.bin")
+    images = read_images_binary(sparse0_path / "images.bin")
+    with (sparse0_path / "points3D.bin").open("rb") as fid:
+        num_points = struct.unpack("<Q", fid.read(8))[0]
+
+    if len(cameras) == 0 or len(images) == 0 or num_points == 0:
+        raise FailedProcess(f"Sparse model {sparse0_path} is empty.")
+
+    missing_cameras = {image.camera_id for image in images.values()} - set(cameras.keys())
+    if missing_cameras:
+        raise FailedProcess(f"Sparse model references unknown cameras: {sorted(missing_cameras)}.")
+
+    manifest = manifest if manifest is not None else FrameManifest.load(image_path)
+    unknown_images = [image.name for image in images.values() if image.name not in manifest]
+    if unknown_images:
+        raise FailedProcess(f"Sparse model references {len(unknown_images)} images missing from {image_path}.")
+
+    total = len(manifest)
+    if total and len(images) / total < min_registered_ratio:
+        console.log(f"⚠️ Only {len(images)}/{total} images were registered in {sparse0_path}.")
+
+    console.log(f"🔎 Sparse model: {len(cameras)} cameras, {len(images)} images, {num_points} points.")
+    return len(images)
+
 def colmap_image_undistortion(
         image_path: Path,
         sparse0_path: Path,
         source_path: Path,
         colmap_command: str = "colmap",
+        manifest: Optional[FrameManifest] = None,
         stream_file: Optional[IOBase] = None
     ):
-    total = len(list(image_path.glob("*.jpg")))
+    manifest = manifest if manifest is not None else FrameManifest.load(image_path)
+    total = len(manifest)
     with Progress(console=console) as progress:
         task = progress.add_task("Image Undistortion", total=total)
         cmd = [
@@ -193,26 +372,64 @@ def colmap(
     colmap_command: str = "colmap",
     use_gpu: bool = True,
     skip_matching: bool = False,
+    mapper: Literal["auto", "mapper", "hierarchical_mapper"] = "auto",
+    partition_threshold: int = 1_000,
+    leaf_max_num_images: int = 500,
+    dedup_threshold: Optional[int] = None,
+    max_image_size: Optional[int] = None,
+    resize_cache: Optional[FileCache] = None,
+    pyramid_factors: Tuple[int, ...] = (2, 4, 8),
+    pyramid_cache: Optional[FileCache] = None,
     stream_file: Optional[IOBase] = None
 ):
     image_path = source_path / "input"
     if not image_path.exists():
         raise Exception(f"Image path {image_path} does not exist. Exiting.")
 
-    total = len(list(image_path.glob("*.jpg")))
+    manifest = FrameManifest.load(image_path)
+    total = len(manifest)
     if total == 0:
         raise Exception(f"No images found in {image_path}. Exiting.")
 
+    if dedup_threshold is not None:
+        # Every dropped frame removes O(n) pairs from the exhaustive matcher
+        from services.frames import deduplicate_frames
+        dropped = deduplicate_frames(manifest, source_path / "duplicates", dedup_threshold)
+        with (source_path / "dropped_frames.json").open("w") as dropped_file:
+            json.dump({"threshold": dedup_threshold, "dropped": dropped}, dropped_file)
+        total = len(manifest)
+
+    if max_image_size:
+        # Extraction, matching and undistortion all run on the downsized frames
+        from services.frames import resize_frames
+        manifest = resize_frames(
+            manifest,
+            source_path / "input_resized",
+            max_image_size,
+            resize_cache if resize_cache else FileCache(source_path / "resize_cache"),
+        )
+        image_path = manifest.image_path
+
     database_path = source_path / "distorted" / "database.db"
 
     sparse_path = source_path / "distorted" / "sparse"
 
     if not skip_matching:
-        colmap_feature_extraction(database_path, image_path, camera, colmap_command, use_gpu, stream_file)
-        colmap_feature_matching(database_path, image_path, colmap_command, use_gpu, stream_file)
-        colmap_bundle_adjustment(database_path, image_path, sparse_path, colmap_command, stream_file)
+        colmap_feature_extraction(database_path, image_path, camera, colmap_command, use_gpu, manifest, stream_file)
+        colmap_feature_matching(database_path, image_path, colmap_command, use_gpu, manifest, stream_file)
+        if mapper == "auto":
+            mapper = "hierarchical_mapper" if total > partition_threshold else "mapper"
+        if mapper == "hierarchical_mapper":
+            colmap_hierarchical_mapper(
+                database_path, image_path, sparse_path, colmap_command,
+                leaf_max_num_images=leaf_max_num_images, manifest=manifest, stream_file=stream_file
+            )
+            colmap_model_merger(sparse_path, colmap_command, stream_file)
+        else:
+            colmap_bundle_adjustment(database_path, image_path, sparse_path, colmap_command, manifest, stream_file)
+        check_sparse_model(sparse_path / "0", image_path, manifest=manifest)
 
-    colmap_image_undistortion(image_path, sparse_path / "0", source_path, colmap_command, stream_file)
+    colmap_image_undistortion(image_path, sparse_path / "0", source_path, colmap_command, manifest, stream_file)
 
     origin_path = source_path / "sparse"
     destination_path = source_path / "sparse" / "0"
@@ -225,6 +442,15 @@ def colmap(
         destination_file = os.path.join(destination_path, file)
         shutil.copy(source_file, destination_file)
 
+    if pyramid_factors:
+        # Downscaled copies of the undistorted images for lower resolution trainings
+        from services.frames import build_image_pyramid
+        build_image_pyramid(
+            FrameManifest.load(source_path / "images"),
+            pyramid_cache if pyramid_cache else FileCache(source_path / "pyramid_cache"),
+            tuple(pyramid_factors),
+        )
+
 if __name__ == "__main__":
     import tempfile
     with tempfile.NamedTemporaryFile(mode='w+t') as temp_file:
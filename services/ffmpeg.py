@@ -1,24 +1,351 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from io import IOBase
+import json
+import math
 import os
+import shutil
 import subprocess
-from typing import Optional
+import threading
+import time
+from typing import Callable, Iterator, Literal, Optional
 from pathlib import Path
+import numpy as np
 from rich.console import Console
+from services.manifest import FrameManifest
 
 console = Console()
 
+# Average size of a JPEG frame at qscale 1, used to plan the disk usage
+JPEG_BYTES_PER_PIXEL = 0.5
+
 class FailedProcess(Exception):
     pass
 
+def parse_time(value: str) -> float:
+    """Parse an ffmpeg time duration (`SS[.m]` or `[HH:]MM:SS[.m]`) into seconds."""
+    seconds = 0.0
+    try:
+        for part in str(value).split(":"):
+            seconds = seconds * 60 + float(part)
+    except ValueError:
+        raise FailedProcess(f"Invalid time {value!r}, expected SS[.m] or [HH:]MM:SS[.m].")
+    if seconds < 0 or not math.isfinite(seconds):
+        raise FailedProcess(f"Invalid time {value!r}, it must be a positive duration.")
+    return seconds
+
+def parse_range(
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        duration: Optional[float] = None
+        ) -> tuple[float, Optional[float]]:
+    """Start and end (None for the end of the video) of the extracted range, in seconds."""
+    start = parse_time(start_time) if start_time else 0.0
+    end = None
+    if end_time:
+        end = parse_time(end_time)
+    elif duration:
+        end = start + float(duration)
+    if end is not None and end <= start:
+        raise FailedProcess(f"The end of the range ({end:g}s) must come after its start ({start:g}s).")
+    return start, end
+
+def stream_rotation(stream: dict) -> int:
+    """
+    Rotation of a probed stream in degrees: the legacy `rotate` tag, or the
+    display matrix side data where current ffmpeg versions store it.
+    """
+    rotation = stream.get("tags", {}).get("rotate")
+    if rotation is None:
+        rotation = next(
+            (side_data["rotation"] for side_data in stream.get("side_data_list", []) if "rotation" in side_data),
+            0,
+        )
+    return int(round(float(rotation)))
+
+def _positive_number(value) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number > 0 else None
+
+def ffprobe(video_path: Path, ffprobe_command: str = "ffprobe") -> dict:
+    """Return the duration, resolution, frame rate and codec of the first video stream."""
+    cmd = [
+        ffprobe_command,
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', (
+            'stream=width,height,codec_name,avg_frame_rate,nb_frames:stream_tags=rotate'
+            ':stream_side_data=rotation:format=duration,size'
+        ),
+        '-of', 'json',
+        str(video_path)
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise FailedProcess(f"Error probing {video_path}: {result.stderr.strip()}")
+    info = json.loads(result.stdout)
+    if not info.get("streams"):
+        raise FailedProcess(f"No video stream found in {video_path}.")
+    stream = info["streams"][0]
+    width, height = int(stream["width"]), int(stream["height"])
+    # ffmpeg auto-rotates, so the decoded frames are transposed for portrait videos
+    if abs(stream_rotation(stream)) % 180 == 90:
+        width, height = height, width
+    numerator, _, denominator = stream.get("avg_frame_rate", "0/1").partition("/")
+    return {
+        # None when unknown (live streams, some MKV): ffprobe omits it or reports N/A
+        "duration": _positive_number(info.get("format", {}).get("duration")),
+        "frames": _positive_number(stream.get("nb_frames")),
+        "size": int(info.get("format", {}).get("size", 0)),
+        "width": width,
+        "height": height,
+        "fps": float(numerator) / float(denominator) if float(denominator or 0) else 0.0,
+        "codec": stream.get("codec_name", "unknown"),
+    }
+
+def plan_extraction(
+        probe: dict,
+        frames_path: Path,
+        fps: float,
+        qscale: int = 1,
+        start: float = 0.0,
+        end: Optional[float] = None,
+        max_size: Optional[int] = None,
+        segments: int = 1,
+        disk_budget: Optional[int] = None,
+        max_frames: Optional[int] = None
+        ) -> dict:
+    """
+    Plan a frame extraction from the probed video: expected frame count and
+    disk usage, decoder threads per ffmpeg process and the scale filter.
+    `max_frames` caps the expected frame count (e.g. a keyframe budget).
+
+    Raise `FailedProcess` before anything is decoded if the frames would not
+    fit in the free disk space (or in `disk_budget` bytes when given).
+
+    When neither `end` nor the video duration is known, the plan `end` is None
+    (decode to the end of the stream) and the frame count is estimated from
+    the stream frame count, or left unknown.
+    """
+    duration = probe["duration"]
+    if duration is not None and start >= duration:
+        raise FailedProcess(f"The start time ({start:g}s) is past the end of the video ({duration:g}s).")
+    if end is None:
+        end = duration
+    elif duration:
+        end = min(end, duration)
+    # Only used for the estimates: a guessed end must never truncate the extraction
+    if end is not None:
+        seconds = end - start
+    elif probe.get("frames") and probe["fps"]:
+        seconds = probe["frames"] / probe["fps"] - start
+    else:
+        seconds = None
+    width, height = probe["width"], probe["height"]
+    scale_filter = None
+    if max_size and max(width, height) > max_size:
+        scale = max_size / max(width, height)
+        width, height = int(width * scale) // 2 * 2, int(height * scale) // 2 * 2
+        # Plain software scaling works with any decoder / hardware
+        scale_filter = f"scale={width}:{height}:flags=lanczos"
+
+    expected_frames = max(0, math.ceil(seconds * fps)) if seconds is not None else None
+    if max_frames is not None:
+        expected_frames = min(expected_frames, max_frames) if expected_frames is not None else max_frames
+    expected_bytes = int((expected_frames or 0) * width * height * JPEG_BYTES_PER_PIXEL / qscale)
+    free_bytes = shutil.disk_usage(frames_path).free
+    budget = min(free_bytes, disk_budget) if disk_budget is not None else free_bytes
+    plan = {
+        "start": start,
+        "end": end,
+        "seconds": seconds,
+        "width": width,
+        "height": height,
+        "codec": probe["codec"],
+        "expected_frames": expected_frames,
+        "expected_bytes": expected_bytes,
+        "budget_bytes": budget,
+        "threads": max(1, (os.cpu_count() or 1) // max(1, segments)),
+        "scale_filter": scale_filter,
+    }
+    if seconds is None:
+        console.log(f"📋 {probe['codec']} {probe['width']}x{probe['height']}, unknown duration -> frames at {width}x{height}")
+    else:
+        console.log(
+            f"📋 {probe['codec']} {probe['width']}x{probe['height']}, {seconds:.1f}s -> "
+            f"{expected_frames} frames at {width}x{height}, ~{expected_bytes / 1e6:.0f} MB"
+        )
+    if expected_bytes > budget:
+        raise FailedProcess(
+            f"Extraction would need ~{expected_bytes / 1e6:.0f} MB but only {budget / 1e6:.0f} MB are available."
+        )
+    return plan
+
+class ExtractionProgress:
+    """
+    Aggregate the `-progress` reports of one or more ffmpeg processes into a
+    single time-based progress with an ETA, mirrored to `stream_file`.
+    Without `total_seconds` (unknown duration) only the decoded time is reported.
+    """
+
+    def __init__(self, total_seconds: Optional[float], stream_file: Optional[IOBase] = None, interval: float = 1.0):
+        self.total_seconds = max(total_seconds, 1e-6) if total_seconds is not None else None
+        self.stream_file = stream_file
+        self.interval = interval
+        self.decoded = {}
+        self.started = time.monotonic()
+        self.reported = 0.0
+        self.lock = threading.Lock()
+
+    def finish(self):
+        if self.total_seconds is None:
+            self.update(0, sum(self.decoded.values()), force=True)
+            return
+        with self.lock:
+            self.decoded = {}
+        self.update(0, self.total_seconds, force=True)
+
+    def update(self, key: int, seconds: float, force: bool = False):
+        with self.lock:
+            self.decoded[key] = seconds
+            now = time.monotonic()
+            if not force and now - self.reported < self.interval:
+                return
+            self.reported = now
+            elapsed = now - self.started
+            if self.total_seconds is None:
+                message = f"Progress: {sum(self.decoded.values()):.1f}s decoded - elapsed {elapsed:.0f}s"
+            else:
+                fraction = min(1.0, sum(self.decoded.values()) / self.total_seconds)
+                eta = elapsed * (1 - fraction) / fraction if fraction > 0 else float("nan")
+                message = f"Progress: {fraction * 100:5.1f}% - elapsed {elapsed:.0f}s - ETA {eta:.0f}s"
+            console.log(message)
+            if self.stream_file:
+                self.stream_file.write(message + "\n")
+                self.stream_file.flush()
+
+def _ffmpeg_extract_range(
+        video_path: Path,
+        destination: Path,
+        fps: float,
+        qscale: int,
+        start: float = 0.0,
+        duration: Optional[float] = None,
+        ffmpeg_command: str = "ffmpeg",
+        stream_file: Optional[IOBase] = None,
+        pattern: str = '%06d.jpg',
+        video_filter: Optional[str] = None,
+        variable_rate: bool = False,
+        threads: Optional[int] = None,
+        on_progress: Optional[Callable[[float], None]] = None
+        ) -> int:
+    # The output pattern is absolute: ffmpeg never depends on the process CWD,
+    # so any number of extractions can run concurrently in the same process.
+    destination.mkdir(parents=True, exist_ok=True)
+    cmd = [ffmpeg_command, '-nostdin', '-nostats', '-progress', 'pipe:1']
+    if threads:
+        cmd += ['-threads', str(threads)]
+    if start:
+        cmd += ['-ss', f"{start:.6f}"]
+    if duration is not None:
+        cmd += ['-t', f"{duration:.6f}"]
+    cmd += [
+        '-i', str(video_path),
+        '-qscale:v', str(qscale),
+        '-qmin', '1',
+        '-vf', video_filter if video_filter else f"fps={fps}",
+    ]
+    if variable_rate:
+        # Only write the frames kept by the filter instead of duplicating them
+        cmd += ['-vsync', 'vfr']
+    cmd += [str(destination / pattern)]
+    console.log(f"💻 Executing command: {' '.join(cmd)}")
+
+    # stdout carries the key=value progress reports, the logs go to stream_file
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stream_file, text=True) as process:
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            # out_time_ms is in microseconds as well, despite its name
+            if key in ("out_time_us", "out_time_ms") and value.isdigit() and on_progress:
+                on_progress(int(value) / 1e6)
+    return process.returncode
+
+def ffmpeg_extract_segments(
+        video_path: Path,
+        frame_destination: Path,
+        start: float,
+        end: float,
+        segments: int,
+        fps: float = 1,
+        qscale: int = 1,
+        ffmpeg_command: str = "ffmpeg",
+        video_filter: Optional[str] = None,
+        threads: Optional[int] = None,
+        progress: Optional[ExtractionProgress] = None,
+        stream_file: Optional[IOBase] = None
+        ) -> dict[str, float]:
+    """
+    Decode [start, end) of the video as `segments` time ranges in parallel
+    ffmpeg processes, then number the frames globally in time order.
+
+    Segment boundaries are aligned on the 1/fps sampling grid so that every
+    frame keeps the timestamp a single ffmpeg pass would have given it.
+    Return the timestamp of every extracted frame.
+    """
+    steps = math.ceil((end - start) * fps)
+    steps_per_segment = math.ceil(steps / segments)
+    ranges = [
+        (start + i * steps_per_segment / fps, min(steps_per_segment, steps - i * steps_per_segment) / fps)
+        for i in range(segments) if i * steps_per_segment < steps
+    ]
+    if not ranges:
+        raise FailedProcess(f"Nothing to extract between {start:g}s and {end:g}s.")
+    segment_paths = [frame_destination / f".segment_{i:03d}" for i in range(len(ranges))]
+    console.log(f"✂️  Decoding {len(ranges)} segments of {steps_per_segment / fps:.2f}s in parallel")
+
+    def extract(i: int) -> int:
+        return _ffmpeg_extract_range(
+            video_path, segment_paths[i], fps, qscale, ranges[i][0], ranges[i][1],
+            ffmpeg_command, stream_file,
+            video_filter=video_filter, threads=threads,
+            on_progress=(lambda seconds: progress.update(i, seconds)) if progress else None
+        )
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        return_codes = list(executor.map(extract, range(len(ranges))))
+
+    timestamps = {}
+    try:
+        if any(return_codes):
+            raise FailedProcess("Error extracting frames.")
+        index = 1
+        for segment_path, (segment_start, _) in zip(segment_paths, ranges):
+            for k, frame in enumerate(sorted(segment_path.glob("*.jpg"))):
+                name = f"{index:04d}.jpg"
+                frame.replace(frame_destination / name)
+                timestamps[name] = segment_start + k / fps
+                index += 1
+    finally:
+        for segment_path in segment_paths:
+            shutil.rmtree(segment_path, ignore_errors=True)
+    return timestamps
+
 def ffmpeg_extract_frames(
         video_path: Path,
         frames_path: Path,
-        # TODO: Enable these options
-        # start_time: Optional[str] = None,
-        # duration: Optional[float] = None,
-        # end_time: Optional[str]  = None,
+        start_time: Optional[str] = None,
+        duration: Optional[float] = None,
+        end_time: Optional[str]  = None,
         fps: float = 1,
         qscale: int = 1,
+        segments: int = 1,
+        max_size: Optional[int] = None,
+        disk_budget: Optional[int] = None,
+        ffmpeg_command: str = "ffmpeg",
+        ffprobe_command: str = "ffprobe",
         stream_file: Optional[IOBase] = None
         ) -> str:
     frame_destination = frames_path / "input"
@@ -26,60 +353,412 @@ def ffmpeg_extract_frames(
     # Create the directory to store the frames
     frames_path.mkdir(parents=True, exist_ok=True)
     frame_destination.mkdir(parents=True, exist_ok=True)
-    # Store the current working directory
-    cwd = os.getcwd()
-    # Change the current working directory to frame_destination
-    os.chdir(frame_destination)
-    
-    # Construct the ffmpeg command as a list of strings
-    cmd = [
-        'ffmpeg', 
-        '-i', str(video_path), 
-        '-qscale:v', str(qscale),
-        '-qmin', '1',
-        '-vf', f"fps={fps}",
-        '%04d.jpg'
-    ]
 
-    console.log(f"💻 Executing command: {' '.join(cmd)}")
-    
-    _stdout = stream_file if stream_file else subprocess.PIPE
-    with subprocess.Popen(cmd, stdout=_stdout, stderr=subprocess.STDOUT, text=True) as process:
-        if process.stdout:
-            for line in process.stdout:
-                print(line)
-                
-    # Change the current working directory back to the original
-    os.chdir(cwd)
-
-    return_code = process.returncode
-    
-    if return_code == 0:
+    start, end = parse_range(start_time, end_time, duration)
+
+    plan = plan_extraction(
+        ffprobe(video_path, ffprobe_command), frames_path, fps, qscale,
+        start=start, end=end, max_size=max_size, segments=segments, disk_budget=disk_budget
+    )
+    end = plan["end"]
+    video_filter = f"fps={fps},{plan['scale_filter']}" if plan["scale_filter"] else None
+    progress = ExtractionProgress(plan["seconds"], stream_file)
+
+    if segments > 1 and end is None:
+        # Segments need to know where the video ends
+        console.log("⚠️ Unknown video duration, decoding in a single pass")
+        segments = 1
+    if segments > 1:
+        timestamps = ffmpeg_extract_segments(
+            video_path, frame_destination, start, end, segments,
+            fps=fps, qscale=qscale, ffmpeg_command=ffmpeg_command,
+            video_filter=video_filter, threads=plan["threads"],
+            progress=progress, stream_file=stream_file
+        )
         console.log(f"✅ Images Successfully Extracted! Path: {frames_path}")
     else:
+        return_code = _ffmpeg_extract_range(
+            video_path, frame_destination, fps, qscale,
+            start=start, duration=end - start if end is not None else None,
+            ffmpeg_command=ffmpeg_command, stream_file=stream_file, pattern='%04d.jpg',
+            video_filter=video_filter, threads=plan["threads"],
+            on_progress=lambda seconds: progress.update(0, seconds)
+        )
+        
+        if return_code == 0:
+            console.log(f"✅ Images Successfully Extracted! Path: {frames_path}")
+        else:
+            raise FailedProcess("Error extracting frames.")
+
+        # Frame N is the (N-1)th sample of the fps filter
+        timestamps = {
+            path.name: start + (int(path.stem) - 1) / fps
+            for path in frame_destination.glob("*.jpg") if path.stem.isdigit()
+        }
+    progress.finish()
+
+    manifest = FrameManifest.load(frame_destination)
+    manifest.set_timestamps(timestamps)
+    manifest.save()
+
+    return frames_path
+
+def ffmpeg_stream_frames(
+        video_path: Path,
+        fps: float,
+        size: tuple[int, int],
+        pix_fmt: Literal["rgb24", "gray"] = "rgb24",
+        start: float = 0.0,
+        duration: Optional[float] = None,
+        chunk_size: int = 16,
+        ffmpeg_command: str = "ffmpeg"
+        ) -> Iterator[np.ndarray]:
+    """
+    Decode the video at `fps` and `size` (width, height) as rawvideo on a pipe
+    and yield chunks of up to `chunk_size` frames, shaped (n, height, width[, 3]).
+
+    The chunks are views into one reusable buffer: copy any frame that must
+    outlive the next iteration.
+    """
+    width, height = size
+    channels = 3 if pix_fmt == "rgb24" else 1
+    cmd = [ffmpeg_command, '-nostdin', '-v', 'error']
+    if start:
+        cmd += ['-ss', f"{start:.6f}"]
+    if duration is not None:
+        cmd += ['-t', f"{duration:.6f}"]
+    cmd += [
+        '-i', str(video_path),
+        '-vf', f"fps={fps},scale={width}:{height}",
+        '-f', 'rawvideo',
+        '-pix_fmt', pix_fmt,
+        'pipe:1'
+    ]
+    console.log(f"💻 Executing command: {' '.join(cmd)}")
+
+    shape = (chunk_size, height, width, channels) if channels > 1 else (chunk_size, height, width)
+    buffer = np.empty(shape, dtype=np.uint8)
+    frame_bytes = buffer[0].nbytes
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        view = memoryview(buffer.reshape(-1))
+        while True:
+            filled = 0
+            while filled < view.nbytes:
+                read = process.stdout.readinto(view[filled:])
+                if not read:
+                    break
+                filled += read
+            count = filled // frame_bytes
+            if count:
+                yield buffer[:count]
+            if filled < view.nbytes:
+                break
+
+    if process.returncode != 0:
+        raise FailedProcess("Error decoding the video stream.")
+
+def ffmpeg_motion_profile(
+        video_path: Path,
+        sample_fps: float,
+        start: float = 0.0,
+        duration: Optional[float] = None,
+        size: tuple[int, int] = (160, 90),
+        ffmpeg_command: str = "ffmpeg",
+        on_progress: Optional[Callable[[float], None]] = None
+        ) -> np.ndarray:
+    """
+    Decode the video at `sample_fps` as tiny grayscale frames piped from
+    ffmpeg and return the mean absolute difference between consecutive
+    samples, a cheap proxy for the camera motion (the first sample is 0).
+    `on_progress` gets the decoded seconds after every chunk.
+    """
+    motion = []
+    previous = None
+    for chunk in ffmpeg_stream_frames(
+        video_path, sample_fps, size, pix_fmt="gray",
+        start=start, duration=duration, ffmpeg_command=ffmpeg_command
+    ):
+        frames = chunk.astype(np.int16)
+        if previous is None:
+            motion.append(0.0)
+        else:
+            motion.append(float(np.abs(frames[0] - previous).mean()))
+        motion.extend(np.abs(np.diff(frames, axis=0)).mean(axis=(1, 2)).tolist())
+        previous = frames[-1]
+        if on_progress:
+            on_progress(len(motion) / sample_fps)
+    return np.asarray(motion)
+
+def ffmpeg_stream_extract(
+        video_path: Path,
+        frames_path: Path,
+        fps: float = 1,
+        qscale: int = 1,
+        sharpness_oversample: int = 1,
+        dedup_threshold: Optional[int] = None,
+        max_size: Optional[int] = None,
+        start_time: Optional[str] = None,
+        duration: Optional[float] = None,
+        end_time: Optional[str]  = None,
+        chunk_size: int = 16,
+        disk_budget: Optional[int] = None,
+        ffmpeg_command: str = "ffmpeg",
+        ffprobe_command: str = "ffprobe",
+        stream_file: Optional[IOBase] = None
+        ) -> str:
+    """
+    Streaming alternative to `ffmpeg_extract_frames` followed by the frame
+    filters: ffmpeg decodes (and downsizes to `max_size`) straight into NumPy
+    buffers, the sharpness selection and near-duplicate rejection run on the
+    stream and only the accepted frames are ever encoded to JPEG.
+    """
+    from PIL import Image
+    from services.utils.bktree import BKTree
+    from services.utils.image_metrics import dhash, hamming_distance, laplacian_variance
+
+    frame_destination = frames_path / "input"
+    frame_destination.mkdir(parents=True, exist_ok=True)
+
+    start, end = parse_range(start_time, end_time, duration)
+
+    plan = plan_extraction(
+        ffprobe(video_path, ffprobe_command), frames_path, fps, qscale,
+        start=start, end=end, max_size=max_size, disk_budget=disk_budget
+    )
+    width, height, end = plan["width"], plan["height"], plan["end"]
+    progress = ExtractionProgress(plan["seconds"], stream_file)
+
+    # ffmpeg's mjpeg qscale (1-31) roughly maps onto the libjpeg quality scale
+    quality = max(50, 100 - 3 * (qscale - 1))
+    sample_fps = fps * sharpness_oversample
+    tree = BKTree(hamming_distance)
+    timestamps = {}
+    best = np.empty((height, width, 3), dtype=np.uint8)
+    best_score, best_timestamp, window = -1.0, 0.0, None
+    decoded = duplicates = 0
+
+    def accept(frame: np.ndarray, timestamp: float, gray: np.ndarray):
+        nonlocal duplicates
+        if dedup_threshold is not None:
+            frame_hash = dhash(gray)
+            if tree.find(frame_hash, dedup_threshold):
+                duplicates += 1
+                return
+            tree.add(frame_hash)
+        name = f"{len(timestamps) + 1:04d}.jpg"
+        timestamps[name] = timestamp
+        futures.append(encoder.submit(
+            Image.fromarray(frame.copy()).save, frame_destination / name, quality=quality
+        ))
+        # Bound the frame copies held in memory by the encoders
+        while len(futures) > max_pending:
+            futures.popleft().result()
+
+    def to_gray(frame: np.ndarray) -> np.ndarray:
+        # Metrics only need a quarter resolution luma
+        return frame[::4, ::4] @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    encoders = os.cpu_count() or 1
+    max_pending = 2 * encoders
+    futures = deque()
+    with ThreadPoolExecutor(max_workers=encoders) as encoder:
+        for chunk in ffmpeg_stream_frames(
+            video_path, sample_fps, (width, height),
+            start=start, duration=end - start if end is not None else None,
+            chunk_size=chunk_size, ffmpeg_command=ffmpeg_command
+        ):
+            progress.update(0, (decoded + len(chunk)) / sample_fps)
+            for frame in chunk:
+                timestamp = start + decoded / sample_fps
+                decoded += 1
+                if sharpness_oversample <= 1:
+                    accept(frame, timestamp, to_gray(frame))
+                    continue
+                frame_window = (decoded - 1) // sharpness_oversample
+                if window is not None and frame_window != window:
+                    accept(best, best_timestamp, to_gray(best))
+                    best_score = -1.0
+                window = frame_window
+                score = laplacian_variance(to_gray(frame))
+                if score > best_score:
+                    best[...] = frame
+                    best_score, best_timestamp = score, timestamp
+        if window is not None and best_score >= 0:
+            accept(best, best_timestamp, to_gray(best))
+        for future in futures:
+            future.result()
+    progress.finish()
+
+    manifest = FrameManifest.load(frame_destination)
+    manifest.set_timestamps(timestamps)
+    manifest.save()
+    message = (
+        f"Streamed {decoded} frames at {width}x{height}, kept {len(timestamps)} "
+        f"({duplicates} near-duplicates dropped)"
+    )
+    console.log(f"✅ {message}. Path: {frames_path}")
+    if stream_file:
+        stream_file.write(message + "\n")
+    return frames_path
+
+def select_keyframes(motion: np.ndarray, budget: int) -> np.ndarray:
+    """
+    Pick at most `budget` samples so that the same amount of motion builds up
+    between two consecutive keyframes. Static parts of the video produce
+    no keyframe, fast moves produce many.
+    """
+    cumulative = np.cumsum(motion)
+    if len(motion) == 0 or cumulative[-1] == 0 or budget <= 1:
+        return np.zeros(min(1, len(motion)), dtype=int)
+    thresholds = np.arange(1, budget) * (cumulative[-1] / budget)
+    indices = np.searchsorted(cumulative, thresholds)
+    return np.unique(np.concatenate([[0], indices]))
+
+def ffmpeg_extract_keyframes(
+        video_path: Path,
+        frames_path: Path,
+        budget: int,
+        sample_fps: float = 4,
+        start_time: Optional[str] = None,
+        duration: Optional[float] = None,
+        end_time: Optional[str]  = None,
+        fps: float = 1,
+        qscale: int = 1,
+        max_size: Optional[int] = None,
+        disk_budget: Optional[int] = None,
+        ffmpeg_command: str = "ffmpeg",
+        ffprobe_command: str = "ffprobe",
+        stream_file: Optional[IOBase] = None
+        ) -> str:
+    """
+    Motion-adaptive alternative to `ffmpeg_extract_frames`: the video is
+    analysed at `sample_fps` and at most `budget` keyframes are extracted
+    where enough parallax has built up. `fps` is only used to report how
+    many frames a fixed-rate extraction would have produced.
+    """
+    frame_destination = frames_path / "input"
+    frame_destination.mkdir(parents=True, exist_ok=True)
+
+    start, end = parse_range(start_time, end_time, duration)
+
+    # At most `budget` frames are written, whatever the analysis rate
+    plan = plan_extraction(
+        ffprobe(video_path, ffprobe_command), frames_path, sample_fps, qscale,
+        start=start, end=end, max_size=max_size, disk_budget=disk_budget, max_frames=budget
+    )
+    end = plan["end"]
+    range_duration = end - start if end is not None else None
+    # The range is decoded twice: once for the analysis, once for the extraction
+    progress = ExtractionProgress(2 * plan["seconds"] if plan["seconds"] is not None else None, stream_file)
+
+    console.log(f"🏃 Analysing camera motion of {video_path} at {sample_fps} fps")
+    motion = ffmpeg_motion_profile(
+        video_path, sample_fps, start, range_duration, ffmpeg_command=ffmpeg_command,
+        on_progress=lambda seconds: progress.update(0, seconds)
+    )
+    keyframes = select_keyframes(motion, budget)
+
+    select = "+".join(f"eq(n\\,{index})" for index in keyframes)
+    # Only the selected frames are scaled
+    video_filter = f"fps={sample_fps},select='{select}'"
+    if plan["scale_filter"]:
+        video_filter += f",{plan['scale_filter']}"
+    return_code = _ffmpeg_extract_range(
+        video_path, frame_destination, sample_fps, qscale,
+        start=start, duration=range_duration,
+        ffmpeg_command=ffmpeg_command, stream_file=stream_file, pattern='%04d.jpg',
+        video_filter=video_filter, variable_rate=True, threads=plan["threads"],
+        on_progress=lambda seconds: progress.update(1, seconds)
+    )
+    if return_code != 0:
         raise FailedProcess("Error extracting frames.")
+    progress.finish()
+
+    manifest = FrameManifest.load(frame_destination)
+    manifest.set_timestamps({
+        f"{i + 1:04d}.jpg": start + index / sample_fps for i, index in enumerate(keyframes)
+    })
+    manifest.save()
 
+    fixed_rate = math.ceil(len(motion) / sample_fps * fps)
+    console.log(
+        f"✅ Extracted {len(keyframes)} keyframes instead of {fixed_rate} at a fixed {fps} fps "
+        f"({fixed_rate - len(keyframes)} frames saved). Path: {frames_path}"
+    )
+    if stream_file:
+        stream_file.write(f"Adaptive sampling: {len(keyframes)} keyframes, {fixed_rate - len(keyframes)} frames saved vs {fps} fps\n")
     return frames_path
 
 def ffmpeg_run(
         video_path: Path,
         output_path: Path,
         ffmpeg_command: str = "ffmpeg",
-        # TODO: Enable these options
-        # start_time: Optional[str] = None,
-        # duration: Optional[float] = None,
-        # end_time: Optional[str]  = None,
+        start_time: Optional[str] = None,
+        duration: Optional[float] = None,
+        end_time: Optional[str]  = None,
         fps: float = 1,
         qscale: int = 1,
+        sharpness_oversample: int = 1,
+        segments: int = 1,
+        keyframe_budget: Optional[int] = None,
+        streaming: bool = False,
+        dedup_threshold: Optional[int] = None,
+        max_size: Optional[int] = None,
+        disk_budget: Optional[int] = None,
+        ffprobe_command: str = "ffprobe",
         stream_file: Optional[IOBase] = None
         ) -> str:
     console.log("🌟 Starting the Frames Extraction...")
+    # Fail on an empty or reversed range before anything is probed or decoded
+    parse_range(start_time, end_time, duration)
+    if streaming:
+        frames_path = ffmpeg_stream_extract(
+            video_path,
+            output_path,
+            fps=fps, qscale=qscale,
+            sharpness_oversample=sharpness_oversample,
+            dedup_threshold=dedup_threshold,
+            max_size=max_size,
+            start_time=start_time, duration=duration, end_time=end_time,
+            disk_budget=disk_budget,
+            ffmpeg_command=ffmpeg_command,
+            ffprobe_command=ffprobe_command,
+            stream_file=stream_file
+        )
+        console.log(f"🎉 Frames Extraction Complete! Path: {frames_path}")
+        return frames_path
+
+    if keyframe_budget:
+        # Analyse the motion at least 4 times faster than the fixed-rate fps
+        frames_path = ffmpeg_extract_keyframes(
+            video_path,
+            output_path,
+            keyframe_budget,
+            sample_fps=fps * max(sharpness_oversample, 4),
+            start_time=start_time, duration=duration, end_time=end_time,
+            fps=fps, qscale=qscale,
+            max_size=max_size, disk_budget=disk_budget,
+            ffmpeg_command=ffmpeg_command,
+            ffprobe_command=ffprobe_command,
+            stream_file=stream_file
+        )
+        console.log(f"🎉 Frames Extraction Complete! Path: {frames_path}")
+        return frames_path
+
+    # Extract `sharpness_oversample` candidates per output frame and keep the sharpest
     frames_path = ffmpeg_extract_frames(
         video_path, 
         output_path,
-        fps=fps, qscale=qscale, 
+        start_time=start_time, duration=duration, end_time=end_time,
+        fps=fps * sharpness_oversample, qscale=qscale, 
+        segments=segments, max_size=max_size, disk_budget=disk_budget,
+        ffmpeg_command=ffmpeg_command,
+        ffprobe_command=ffprobe_command,
         stream_file=stream_file
     )
+    if sharpness_oversample > 1:
+        from services.frames import select_sharpest_frames
+        select_sharpest_frames(FrameManifest.load(frames_path / "input"), window=1 / fps)
     console.log(f"🎉 Frames Extraction Complete! Path: {frames_path}")
     return frames_path
 
@@ -0,0 +1,273 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+from pathlib import Path
+from typing import Optional
+from rich.progress import Progress
+from rich.console import Console
+from services.cache import FileCache
+from services.manifest import FrameManifest
+from services.utils.files import link_or_copy
+
+console = Console()
+
+# EXIF Orientation, and the Exif / GPS sub-IFDs that hold the focal length and position
+ORIENTATION_TAG = 0x0112
+EXIF_IFDS = (0x8769, 0x8825)
+
+def _orientation(path: Path) -> int:
+    from PIL import Image
+    with Image.open(path) as image:
+        return image.getexif().get(ORIENTATION_TAG, 1)
+
+def _resize_frame(src: Path, dst: Path, max_size: int, quality: int) -> Path:
+    from PIL import Image, ImageOps
+    with Image.open(src) as source:
+        # Bake the EXIF orientation into the pixels, COLMAP ignores the tag
+        image = ImageOps.exif_transpose(source)
+        # Keep the rest of the EXIF, COLMAP reads its focal length prior from it
+        exif = source.getexif()
+        for ifd in EXIF_IFDS:
+            exif.get_ifd(ifd)
+        exif.pop(ORIENTATION_TAG, None)
+        image.thumbnail((max_size, max_size), Image.LANCZOS)
+        tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+        image.save(
+            tmp, format="PNG" if dst.suffix.lower() == ".png" else "JPEG", quality=quality,
+            exif=exif.tobytes() if len(exif) else b"",
+        )
+    tmp.replace(dst)
+    return dst
+
+def resize_frames(
+        manifest: FrameManifest,
+        output_path: Path,
+        max_size: int,
+        cache: FileCache,
+        quality: int = 95,
+        workers: Optional[int] = None
+    ) -> FrameManifest:
+    """
+    Downsize every frame of `manifest` so that its long edge is at most
+    `max_size` pixels and write the result into `output_path`.
+
+    Resized frames are cached in `cache` by (frame hash, max_size), so a
+    frame set seen before is linked into place without being decoded again.
+    Frames already small enough are linked as-is, unless they carry an EXIF
+    rotation: those are re-encoded upright too, so the whole set shares one
+    orientation.
+    """
+    output_path.mkdir(parents=True, exist_ok=True)
+    for stale in set(os.listdir(output_path)) - set(manifest.names()):
+        (output_path / stale).unlink()
+
+    pending = {}
+    for frame in manifest:
+        src = manifest.image_path / frame["name"]
+        if max(frame["width"], frame["height"]) <= max_size and _orientation(src) == 1:
+            link_or_copy(src, output_path / frame["name"])
+            continue
+        name = f"{frame['hash']}_{max_size}{Path(frame['name']).suffix.lower()}"
+        cached = cache.lookup(name)
+        if cached is not None:
+            link_or_copy(cached, output_path / frame["name"])
+        else:
+            pending[frame["name"]] = (src, cache.path(name))
+
+    console.log(f"🖼️  Resizing {len(pending)} frames to {max_size}px ({len(manifest) - len(pending)} reused)")
+    with Progress(console=console) as progress:
+        task = progress.add_task("Resizing Frames", total=len(pending))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                name: executor.submit(_resize_frame, src, cached, max_size, quality)
+                for name, (src, cached) in pending.items()
+            }
+            for name, future in futures.items():
+                link_or_copy(future.result(), output_path / name)
+                progress.advance(task)
+
+    cache.evict()
+    resized = FrameManifest.load(output_path)
+    resized.set_timestamps({frame["name"]: frame["timestamp"] for frame in manifest})
+    resized.save()
+    console.log(f"✅ Frames resized. Path: {output_path}")
+    return resized
+
+def _score_sharpness(path: Path) -> float:
+    from services.utils.image_metrics import laplacian_variance, load_gray
+    return laplacian_variance(load_gray(path))
+
+def select_sharpest_frames(
+        manifest: FrameManifest,
+        window: float,
+        workers: Optional[int] = None
+    ) -> list[str]:
+    """
+    Keep only the sharpest frame of every `window` seconds of video and delete
+    the others. Sharpness is the Laplacian variance of a downscaled grayscale
+    decode, scored across `workers` processes.
+
+    Return the names of the dropped frames.
+    """
+    names = manifest.names()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        scores = dict(zip(names, executor.map(
+            _score_sharpness,
+            [manifest.image_path / name for name in names],
+            chunksize=max(1, len(names) // (4 * (os.cpu_count() or 1))),
+        )))
+
+    best = {}
+    for frame in manifest:
+        bucket = int(round(frame["timestamp"] / window, 6))
+        if bucket not in best or scores[frame["name"]] > scores[best[bucket]]:
+            best[bucket] = frame["name"]
+
+    kept = set(best.values())
+    dropped = [name for name in names if name not in kept]
+    for name in dropped:
+        (manifest.image_path / name).unlink()
+        manifest.remove(name)
+    manifest.save()
+    console.log(f"🔍 Kept the {len(kept)} sharpest frames, dropped {len(dropped)} blurrier candidates")
+    return dropped
+
+def _perceptual_hash(path: Path) -> int:
+    from services.utils.image_metrics import dhash, load_gray
+    return dhash(load_gray(path, max_size=64))
+
+def deduplicate_frames(
+        manifest: FrameManifest,
+        duplicates_path: Path,
+        threshold: int = 4,
+        workers: Optional[int] = None
+    ) -> list[str]:
+    """
+    Move near-duplicate frames (paused video, bursts) out of the frame set.
+
+    Frames are hashed in parallel with a 64 bit difference hash and visited in
+    time order: a frame whose hash lies within `threshold` bits of an already
+    kept frame is moved to `duplicates_path`. Kept hashes live in a BK-tree so
+    the lookups stay sub-quadratic. Return the names of the dropped frames.
+    """
+    from services.utils.bktree import BKTree
+    from services.utils.image_metrics import hamming_distance
+
+    frames = sorted(manifest, key=lambda frame: (frame["timestamp"], frame["name"]))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        hashes = list(executor.map(
+            _perceptual_hash,
+            [manifest.image_path / frame["name"] for frame in frames],
+            chunksize=max(1, len(frames) // (4 * (os.cpu_count() or 1))),
+        ))
+
+    tree = BKTree(hamming_distance)
+    dropped = []
+    for frame, frame_hash in zip(frames, hashes):
+        if tree.find(frame_hash, threshold):
+            dropped.append(frame["name"])
+        else:
+            tree.add(frame_hash)
+
+    if dropped:
+        duplicates_path.mkdir(parents=True, exist_ok=True)
+    for name in dropped:
+        (manifest.image_path / name).replace(duplicates_path / name)
+        manifest.remove(name)
+    manifest.save()
+    console.log(f"👯 Dropped {len(dropped)} near-duplicate frames, {len(manifest)} left")
+    return dropped
+
+PYRAMID_FACTORS = (2, 4, 8)
+
+def pyramid_path(image_path: Path, factor: int) -> Path:
+    """`images` -> `images_2`, the layout the Gaussian Splatting trainers expect."""
+    return image_path if factor == 1 else image_path.with_name(f"{image_path.name}_{factor}")
+
+def _downscale_frame(src: Path, targets: dict[int, Path], quality: int) -> dict[int, Path]:
+    from PIL import Image
+    with Image.open(src) as image:
+        width, height = image.size
+        # JPEG draft mode decodes straight at 1/2, 1/4 or 1/8 scale in the DCT
+        image.draft(image.mode, (width // min(targets), height // min(targets)))
+        image.load()
+        for factor in sorted(targets):
+            dst = targets[factor]
+            level = image.resize((max(1, round(width / factor)), max(1, round(height / factor))), Image.LANCZOS)
+            tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+            level.save(tmp, format="PNG" if dst.suffix.lower() == ".png" else "JPEG", quality=quality)
+            tmp.replace(dst)
+    return targets
+
+def build_image_pyramid(
+        manifest: FrameManifest,
+        cache: FileCache,
+        factors: tuple[int, ...] = PYRAMID_FACTORS,
+        quality: int = 95,
+        workers: Optional[int] = None
+    ) -> dict[int, FrameManifest]:
+    """
+    Write 1/`factor` downscaled copies of every frame of `manifest` next to
+    its directory (`images` -> `images_2`, `images_4`, ...).
+
+    Every frame is decoded once for all its missing levels, in parallel, and
+    the levels are cached in `cache` by (frame hash, factor).
+    """
+    for factor in factors:
+        level_path = pyramid_path(manifest.image_path, factor)
+        level_path.mkdir(parents=True, exist_ok=True)
+        for stale in set(os.listdir(level_path)) - set(manifest.names()):
+            (level_path / stale).unlink()
+
+    pending = {}
+    for frame in manifest:
+        suffix = Path(frame["name"]).suffix.lower()
+        targets = {}
+        for factor in factors:
+            name = f"{frame['hash']}_x{factor}{suffix}"
+            cached = cache.lookup(name)
+            if cached is not None:
+                link_or_copy(cached, pyramid_path(manifest.image_path, factor) / frame["name"])
+            else:
+                targets[factor] = cache.path(name)
+        if targets:
+            pending[frame["name"]] = targets
+
+    console.log(f"🔻 Building the x{'/x'.join(map(str, factors))} image pyramid of {len(pending)} frames ({len(manifest) - len(pending)} cached)")
+    with Progress(console=console) as progress:
+        task = progress.add_task("Image Pyramid", total=len(pending))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                name: executor.submit(_downscale_frame, manifest.image_path / name, targets, quality)
+                for name, targets in pending.items()
+            }
+            for name, future in futures.items():
+                for factor, cached in future.result().items():
+                    link_or_copy(cached, pyramid_path(manifest.image_path, factor) / name)
+                progress.advance(task)
+
+    cache.evict()
+    levels = {factor: FrameManifest.load(pyramid_path(manifest.image_path, factor)) for factor in factors}
+    console.log(f"✅ Image pyramid built. Path: {manifest.image_path.parent}")
+    return levels
+
+def pyramid_factor(manifest: FrameManifest, resolution: int, factors: tuple[int, ...] = PYRAMID_FACTORS) -> int:
+    """Largest available factor whose frames keep a long edge of at least `resolution` pixels."""
+    long_edge = max((max(frame["width"], frame["height"]) for frame in manifest), default=0)
+    available = [
+        factor for factor in factors
+        if pyramid_path(manifest.image_path, factor).exists() and long_edge / factor >= resolution
+    ]
+    return max(available, default=1)
+
+def stage_pyramid_level(source_path: Path, staging_path: Path, factor: int) -> Path:
+    """
+    Lay out `staging_path` as a training dataset whose `images` are the 1/`factor`
+    level of `source_path`, with symlinks only: nothing is copied.
+    """
+    staging_path.mkdir(parents=True, exist_ok=True)
+    for name, target in [("images", pyramid_path(source_path / "images", factor)), ("sparse", source_path / "sparse")]:
+        link = staging_path / name
+        if link.is_symlink() or link.exists():
+            link.unlink()
+        link.symlink_to(target.absolute(), target_is_directory=True)
+    return staging_path
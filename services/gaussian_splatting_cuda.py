@@ -1,13 +1,115 @@
 from io import IOBase
+import json
 from pathlib import Path
+import re
 import subprocess
-from typing import Optional
+import threading
+from typing import Callable, Optional
 from rich.console import Console
+from services.training_metrics import EarlyStopPolicy, TrainingMetrics, parse_training_line
 import os 
 import shutil
 
 console = Console()
 
+class FailedTraining(Exception):
+    pass
+
+# Key of the run the snapshots of an output directory belong to
+RUN_FILE = "run.json"
+
+def find_snapshots(output_path: Path) -> dict[int, Path]:
+    """Return the point cloud of every `point_cloud/iteration_N` snapshot, by iteration."""
+    snapshots = {}
+    for ply in (output_path / "point_cloud").glob("iteration_*/point_cloud.ply"):
+        match = re.fullmatch(r"iteration_(\d+)", ply.parent.name)
+        if match:
+            snapshots[int(match.group(1))] = ply
+    return dict(sorted(snapshots.items()))
+
+def latest_snapshot(output_path: Path) -> Optional[tuple[int, Path]]:
+    snapshots = find_snapshots(output_path)
+    if not snapshots:
+        return None
+    iteration = max(snapshots)
+    return iteration, snapshots[iteration]
+
+def read_run_key(output_path: Path) -> Optional[str]:
+    try:
+        return json.loads((output_path / RUN_FILE).read_text())["key"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def start_run(output_path: Path, run_key: Optional[str], resume: bool) -> bool:
+    """
+    Record `run_key` as the run of `output_path` and return True if its snapshots
+    can be resumed, i.e. they were written by a run with the same key. Snapshots
+    of any other run are removed: they were trained on other inputs or parameters.
+    """
+    if resume and run_key is not None and read_run_key(output_path) == run_key:
+        return True
+    for name in ("point_cloud", "snapshots"):
+        shutil.rmtree(output_path / name, ignore_errors=True)
+    (output_path / "final_point_cloud.ply").unlink(missing_ok=True)
+    # Replaced, never rewritten in place: the file may be linked from the artifact cache
+    tmp_path = output_path / f".{RUN_FILE}.tmp"
+    tmp_path.write_text(json.dumps({"key": run_key}))
+    tmp_path.replace(output_path / RUN_FILE)
+    return False
+
+class SnapshotWatcher(threading.Thread):
+    """
+    Poll the trainer output directory while it runs and publish every new
+    iteration snapshot to `output_path / "snapshots"` once its size is stable
+    (i.e. the trainer finished writing it), then call `on_snapshot`. `latest`
+    is the newest published iteration, a snapshot known to be complete.
+    """
+
+    def __init__(
+            self,
+            output_path: Path,
+            on_snapshot: Optional[Callable[[int, Path], None]] = None,
+            interval: float = 5.0
+        ):
+        super().__init__(daemon=True)
+        self.output_path = output_path
+        self.on_snapshot = on_snapshot
+        self.interval = interval
+        self.published = set(int(path.stem.split("_")[-1]) for path in (output_path / "snapshots").glob("iteration_*.ply"))
+        self.latest: Optional[int] = max(self.published, default=None)
+        self.sizes = {}
+        self.stopped = threading.Event()
+        self.final_poll = True
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.poll()
+        if self.final_poll:
+            self.poll(final=True)
+
+    def stop(self, final: bool = True):
+        """Stop polling; with `final`, publish the snapshots left without waiting for a stable size."""
+        self.final_poll = final
+        self.stopped.set()
+        self.join()
+
+    def poll(self, final: bool = False):
+        for iteration, ply in find_snapshots(self.output_path).items():
+            if iteration in self.published:
+                continue
+            size = ply.stat().st_size
+            if not final and self.sizes.get(iteration) != size:
+                self.sizes[iteration] = size
+                continue
+            published = self.output_path / "snapshots" / f"iteration_{iteration}.ply"
+            published.parent.mkdir(exist_ok=True)
+            shutil.copyfile(ply, published)
+            self.published.add(iteration)
+            self.latest = max(self.latest or 0, iteration)
+            console.log(f"📸 Snapshot at iteration {iteration} published to {published}")
+            if self.on_snapshot:
+                self.on_snapshot(iteration, published)
+
 def gaussian_splatting_cuda_training(
         data_path: Path,
         output_path: Path,
@@ -18,8 +120,12 @@ def gaussian_splatting_cuda_training(
         enable_cr_monitoring: bool = False,
         force: bool = False,
         empty_gpu_cache: bool = False,
-        stream_file: Optional[IOBase] = None
-    ) -> str:   
+        early_stop: Optional[EarlyStopPolicy] = None,
+        metrics_path: Optional[Path] = None,
+        device: Optional[int] = None,
+        stream_file: Optional[IOBase] = None,
+        complete_snapshot: Optional[Callable[[], Optional[int]]] = None
+    ) -> dict:   
     """
     Core Options
     -h, --help
@@ -45,13 +151,23 @@ def gaussian_splatting_cuda_training(
 
     -c, --convergence_rate [RATE]
     Set custom average onvergence rate for the training process. Requires the flag --enable-cr-monitoring to be set.
+
+    Python-side monitoring
+    The trainer output is parsed into a compact loss / convergence rate series
+    saved to `metrics_path`. With `enable_cr_monitoring` (or an explicit
+    `early_stop` policy) the trainer is stopped once the run has plateaued and
+    a complete snapshot exists: `complete_snapshot` returns its iteration, by
+    default the latest one found on disk. It is returned as `snapshot`.
+
+    `device` pins the trainer to a single GPU through CUDA_VISIBLE_DEVICES.
     """ 
     
     # export LC_ALL=C
     # export LANG=C
-    os.environ["LC_ALL"] = "C"
-    os.environ["LANG"] = "C"
-    
+    # Set for the trainer only: concurrent runs must not share os.environ
+    env = {**os.environ, "LC_ALL": "C", "LANG": "C"}
+    if device is not None:
+        env["CUDA_VISIBLE_DEVICES"] = str(device)
 
     cmd = [
         gs_command,
@@ -68,19 +184,53 @@ def gaussian_splatting_cuda_training(
 
     console.log(f"💻 Executing command: {' '.join(cmd)}")
 
-    _stdout = stream_file if stream_file else subprocess.PIPE
-    with subprocess.Popen(cmd, stdout=_stdout, stderr=subprocess.STDOUT, text=True) as process:
-        if process.stdout:
-            for line in process.stdout:
+    if early_stop is None and enable_cr_monitoring:
+        early_stop = EarlyStopPolicy(convergence_rate=convergence_rate)
+    if complete_snapshot is None:
+        complete_snapshot = lambda: (latest_snapshot(output_path) or (None,))[0]
+    metrics = TrainingMetrics(metrics_path)
+    last_iteration = 0
+    stopped_at_snapshot = None
+
+    # The output is read here and mirrored to stream_file to monitor the run
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env) as process:
+        for line in process.stdout:
+            if stream_file:
+                stream_file.write(line)
+                stream_file.flush()
+            else:
                 print(line)
-                
+            parsed = parse_training_line(line)
+            if parsed is None:
+                continue
+            metrics.add(*parsed)
+            last_iteration = parsed[0]
+            reason = early_stop.update(*parsed) if early_stop else None
+            # Decided before terminating: the trainer may be killed while writing a newer snapshot
+            stopped_at_snapshot = complete_snapshot() if reason else None
+            if stopped_at_snapshot is not None:
+                metrics.stopped_reason = reason
+                console.log(f"🛑 Stopping early: {reason}")
+                process.terminate()
+                try:
+                    process.wait(timeout=60)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                break
+    metrics.flush()
 
     # Check if the command was successful
     return_code = process.returncode
-    if return_code == 0:
+    if return_code == 0 or metrics.stopped_reason:
         console.log('✅ Successfully splatted frames.')
     else:
         raise Exception('Error splatting frames.')
+    return {
+        "iteration": last_iteration,
+        "stopped_early": metrics.stopped_reason is not None,
+        "stopped_reason": metrics.stopped_reason,
+        "snapshot": stopped_at_snapshot,
+    }
         
 def gaussian_splatting_cuda(
         data_path: Path,
@@ -92,32 +242,76 @@ def gaussian_splatting_cuda(
         enable_cr_monitoring: bool = False,
         force: bool = False,
         empty_gpu_cache: bool = False,
-        stream_file: Optional[IOBase] = None
+        resume: bool = False,
+        run_key: Optional[str] = None,
+        on_snapshot: Optional[Callable[[int, Path], None]] = None,
+        early_stop: Optional[EarlyStopPolicy] = None,
+        metrics_path: Optional[Path] = None,
+        device: Optional[int] = None,
+        stream_file: Optional[IOBase] = None,
+        snapshot_interval: float = 5.0
     ) -> str: 
+    """
+    Train into `output_path` and copy the last snapshot to `final_point_cloud.ply`.
+
+    With `resume`, the snapshots left by an interrupted run are reused only if
+    that run had the same `run_key` (a digest of the inputs and parameters);
+    otherwise they are discarded and the training starts over.
+    """
     # Check if the output path exists
-    if output_path.exists() and not force:
+    if output_path.exists() and not (force or resume):
         raise Exception(f"Output folder already exists. Path: {output_path}, use --force to overwrite.")
 
     # Create the output path if it doesn't exist
     output_path.mkdir(parents=True, exist_ok=True)
 
-    # Execute gaussian_splatting_cuda
-    gaussian_splatting_cuda_training(
-        data_path,
-        output_path,
-        gs_command,
-        iterations,
-        convergence_rate,
-        resolution,
-        enable_cr_monitoring,
-        force,
-        empty_gpu_cache,
-        stream_file
-    )
+    # A previous run of the same inputs already reached the requested iteration, reuse its snapshot
+    snapshot = latest_snapshot(output_path) if start_run(output_path, run_key, resume) else None
+    final_source = None
+    if snapshot and snapshot[0] >= iterations:
+        console.log(f"⏩ Resuming from the snapshot at iteration {snapshot[0]}, skipping training.")
+        iterations = snapshot[0]
+    else:
+        # Execute gaussian_splatting_cuda, publishing snapshots as they appear
+        watcher = SnapshotWatcher(output_path, on_snapshot, snapshot_interval)
+        watcher.start()
+        try:
+            result = gaussian_splatting_cuda_training(
+                data_path,
+                output_path,
+                gs_command,
+                iterations,
+                convergence_rate,
+                resolution,
+                enable_cr_monitoring,
+                force or resume,
+                empty_gpu_cache,
+                early_stop,
+                metrics_path,
+                device,
+                stream_file,
+                complete_snapshot=lambda: watcher.latest
+            )
+        except Exception as e:
+            watcher.stop()
+            # Keep the latest snapshot as the result instead of losing the run
+            snapshot = latest_snapshot(output_path)
+            if snapshot is None:
+                raise
+            shutil.copyfile(src=snapshot[1], dst=output_path / "final_point_cloud.ply")
+            raise FailedTraining(
+                f"{e} The snapshot at iteration {snapshot[0]} was kept as {output_path / 'final_point_cloud.ply'}."
+            ) from e
+        # A snapshot cut short by the early stop must not be published
+        watcher.stop(final=not result["stopped_early"])
+        if result["stopped_early"]:
+            # Keep the snapshot published before the stop decision, newer ones may be truncated
+            iterations = result["snapshot"]
+            final_source = output_path / "snapshots" / f"iteration_{iterations}.ply"
 
     # Copy the /output/point_cloud/iteration_{iteration}/point_cloud.ply to the output_path
     shutil.copyfile(
-        src=output_path / "point_cloud" / f"iteration_{iterations}" / "point_cloud.ply",
+        src=final_source or output_path / "point_cloud" / f"iteration_{iterations}" / "point_cloud.ply",
         dst=output_path / "final_point_cloud.ply"
     )
 
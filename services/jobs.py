@@ -0,0 +1,235 @@
+from contextlib import closing
+import json
+from pathlib import Path
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+import uuid
+from typing_extensions import TypedDict
+from rich.console import Console
+
+console = Console()
+
+Job = TypedDict("Job", {
+    "id": str,
+    "session_id": str,
+    "step": str,
+    "params": dict,
+    "status": str,
+    "priority": int,
+    "attempts": int,
+    "created_at": float,
+    "started_at": Optional[float],
+    "finished_at": Optional[float],
+    "result": Optional[Any],
+    "error": Optional[str],
+})
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    step TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_session ON jobs (session_id, created_at);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, created_at);
+"""
+
+DEFAULT_POOL = "default"
+
+class UnknownStep(Exception):
+    pass
+
+class JobQueue:
+    """
+    Pipeline steps queued in a SQLite database and run by a pool of worker threads.
+
+    Steps are registered by name and called as `step(session_id, **params)`;
+    params and results must be JSON serializable. Jobs survive restarts: jobs
+    found running when the queue starts were interrupted and are queued again,
+    up to `max_attempts` runs.
+
+    `workers` threads serve the default pool. Steps registered in another pool
+    (e.g. trainings waiting for a GPU) are only run by that pool's threads, sized
+    by `pools`, so they can never hold the workers of the other steps.
+    """
+
+    def __init__(
+            self,
+            db_path: Path,
+            workers: int = 2,
+            pools: Optional[Dict[str, int]] = None,
+            max_attempts: int = 2,
+            poll_interval: float = 1.0
+        ):
+        self.db_path = db_path
+        self.pools = {DEFAULT_POOL: workers, **(pools or {})}
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.steps: Dict[str, Callable[..., Any]] = {}
+        self.step_pools: Dict[str, str] = {}
+        self.wakeup = threading.Condition()
+        self.threads: List[threading.Thread] = []
+        self.stopped = threading.Event()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call: sqlite3 connections are bound to their thread
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> Job:
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return Job(**job)
+
+    def register(self, step: str, fn: Callable[..., Any], pool: str = DEFAULT_POOL):
+        if pool not in self.pools:
+            raise ValueError(f"No worker pool named {pool}.")
+        self.steps[step] = fn
+        self.step_pools[step] = pool
+
+    def start(self):
+        """Requeue the jobs interrupted by the previous process and start the workers."""
+        with closing(self._connect()) as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = 'Interrupted by a restart.', finished_at = ? "
+                "WHERE status = ? AND attempts >= ?",
+                (FAILED, time.time(), RUNNING, self.max_attempts),
+            )
+            requeued = connection.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?", (QUEUED, RUNNING)
+            ).rowcount
+        if requeued:
+            console.log(f"♻️  Requeued {requeued} interrupted jobs")
+        for pool, workers in self.pools.items():
+            for index in range(workers):
+                thread = threading.Thread(target=self._work, args=(pool,), name=f"job-{pool}-{index}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self):
+        self.stopped.set()
+        with self.wakeup:
+            self.wakeup.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def enqueue(self, session_id: str, step: str, params: Optional[dict] = None, priority: int = 0) -> str:
+        if step not in self.steps:
+            raise UnknownStep(f"No step named {step} is registered.")
+        job_id = str(uuid.uuid4())
+        with closing(self._connect()) as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, session_id, step, params, status, priority, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, session_id, step, json.dumps(params or {}), QUEUED, priority, time.time()),
+            )
+        with self.wakeup:
+            # Wake every worker: the first idle one of the job's pool takes it
+            self.wakeup.notify_all()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with closing(self._connect()) as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def jobs_for(self, session_id: str) -> List[Job]:
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT * FROM jobs WHERE session_id = ? ORDER BY created_at", (session_id,)
+            ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def is_active(self, session_id: str) -> bool:
+        """True while the session has a queued or running job."""
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT 1 FROM jobs WHERE session_id = ? AND status IN (?, ?) LIMIT 1", (session_id, QUEUED, RUNNING)
+            ).fetchone()
+        return row is not None
+
+    def wait(self, job_id: str, on_update: Optional[Callable[[Job], None]] = None, timeout: Optional[float] = None) -> Job:
+        """Block until the job is done or failed, calling `on_update` whenever its status changes."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        status = None
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            if on_update and job["status"] != status:
+                on_update(job)
+            status = job["status"]
+            if status in (DONE, FAILED) or (deadline is not None and time.monotonic() > deadline):
+                return job
+            time.sleep(self.poll_interval)
+
+    def _claim(self, pool: str) -> Optional[Job]:
+        steps = [step for step, step_pool in self.step_pools.items() if step_pool == pool]
+        if not steps:
+            return None
+        with closing(self._connect()) as connection:
+            # BEGIN IMMEDIATE takes the write lock: two workers never claim the same job
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    f"SELECT * FROM jobs WHERE status = ? AND step IN ({', '.join('?' * len(steps))}) "
+                    "ORDER BY priority, created_at LIMIT 1",
+                    (QUEUED, *steps),
+                ).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                        (RUNNING, time.time(), row["id"]),
+                    )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return self._to_job(row) if row else None
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None):
+        with closing(self._connect()) as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? WHERE id = ?",
+                (status, time.time(), json.dumps(result) if result is not None else None, error, job_id),
+            )
+
+    def _work(self, pool: str):
+        while not self.stopped.is_set():
+            job = self._claim(pool)
+            if job is None:
+                with self.wakeup:
+                    self.wakeup.wait(self.poll_interval)
+                continue
+            console.log(f"🏃 Running job {job['id']} ({job['step']}) of session {job['session_id']}")
+            try:
+                step = self.steps.get(job["step"])
+                if step is None:
+                    raise UnknownStep(f"No step named {job['step']} is registered.")
+                result = step(job["session_id"], **job["params"])
+                self._finish(job["id"], DONE, result=result)
+                console.log(f"✅ Job {job['id']} done")
+            except Exception as e:
+                traceback.print_exc()
+                self._finish(job["id"], FAILED, error=str(e) or type(e).__name__)
+                console.log(f"🚨 Job {job['id']} failed: {e}")
@@ -0,0 +1,75 @@
+import asyncio
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+# Bytes of log sent to a browser at most, older lines are dropped
+LOG_WINDOW = 64 * 1024
+
+def read_tail(path: Path, window: int = LOG_WINDOW) -> str:
+    """Last `window` bytes of the log, starting on a line boundary: the cost does not grow with the log."""
+    if not path.exists():
+        return ""
+    with path.open("rb") as fid:
+        size = fid.seek(0, 2)
+        start = max(0, size - window)
+        fid.seek(start)
+        data = fid.read(window)
+    if start > 0:
+        data = data[data.find(b"\n") + 1:]
+    return data.decode("utf-8", errors="replace")
+
+def read_new(path: Path, offset: int, window: int = LOG_WINDOW) -> Tuple[str, int]:
+    """
+    Complete lines written after byte `offset`, and the offset to resume from.
+
+    Only the trailing `window` bytes of a large backlog are returned, and a log
+    that shrank (rewritten by a new run) is read again from its start.
+    """
+    if not path.exists():
+        return "", 0
+    with path.open("rb") as fid:
+        size = fid.seek(0, 2)
+        if size < offset:
+            offset = 0
+        if size == offset:
+            return "", offset
+        start = max(offset, size - window)
+        fid.seek(start)
+        data = fid.read(size - start)
+    skipped = start > offset
+    end = data.rfind(b"\n") + 1
+    if skipped:
+        # Resume on a line boundary inside the window
+        data = data[data.find(b"\n") + 1:end] if end else b""
+    else:
+        data = data[:end]
+    return data.decode("utf-8", errors="replace"), start + end if end else offset
+
+async def iter_log_events(
+        path: Path,
+        offset: int = 0,
+        window: int = LOG_WINDOW,
+        interval: float = 1.0,
+        keepalive: float = 15.0,
+        stop: Optional[asyncio.Event] = None
+    ) -> AsyncIterator[str]:
+    """
+    Server-sent events carrying the new lines of a log, batched every
+    `interval` seconds. The event id is the byte offset, so a reconnecting
+    client resumes with its Last-Event-ID. A comment is sent every
+    `keepalive` seconds of silence to keep proxies from closing the stream.
+    """
+    # A new client (offset 0) gets the trailing window first, not the whole log
+    idle = 0.0
+    while stop is None or not stop.is_set():
+        text, offset = read_new(path, offset, window)
+        if text:
+            idle = 0.0
+            data = "".join(f"data: {line}\n" for line in text.splitlines())
+            yield f"id: {offset}\n{data}\n"
+        else:
+            idle += interval
+            if idle >= keepalive:
+                idle = 0.0
+                yield ": keepalive\n\n"
+        await asyncio.sleep(interval)
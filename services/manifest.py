@@ -0,0 +1,152 @@
+from hashlib import blake2b
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+from typing_extensions import TypedDict
+from rich.console import Console
+
+console = Console()
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+Frame = TypedDict("Frame", {
+    "name": str,
+    "size": int,
+    "mtime_ns": int,
+    "width": int,
+    "height": int,
+    "hash": str,
+    "timestamp": float,
+})
+
+def hash_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = blake2b(digest_size=16)
+    with path.open("rb") as fid:
+        for chunk in iter(lambda: fid.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_image_size(path: Path) -> tuple[int, int]:
+    # PIL only parses the header here, the pixels are never decoded
+    from PIL import Image
+    with Image.open(path) as image:
+        return image.size
+
+class FrameManifest:
+    """
+    Frames of an image directory, built in a single scan and kept up to date
+    incrementally: a frame is only re-hashed when its size or mtime changed.
+
+    The manifest is stored next to the directory (`input` -> `input_manifest.json`)
+    so that COLMAP never sees it as an image.
+    """
+
+    def __init__(self, image_path: Path, frames: Optional[Dict[str, Frame]] = None):
+        self.image_path = image_path
+        self.frames: Dict[str, Frame] = frames if frames is not None else {}
+
+    @staticmethod
+    def path_for(image_path: Path) -> Path:
+        return image_path.with_name(f"{image_path.name}_manifest.json")
+
+    @classmethod
+    def load(cls, image_path: Path) -> "FrameManifest":
+        manifest_path = cls.path_for(image_path)
+        frames = {}
+        if manifest_path.exists():
+            try:
+                frames = json.loads(manifest_path.read_text())["frames"]
+            except (ValueError, KeyError):
+                console.log(f"⚠️ Ignoring corrupted manifest {manifest_path}")
+        manifest = cls(image_path, frames)
+        manifest.refresh()
+        return manifest
+
+    def refresh(self) -> bool:
+        """Rescan the directory once, return True if the manifest changed."""
+        changed = False
+        seen = set()
+        if self.image_path.exists():
+            with os.scandir(self.image_path) as entries:
+                for entry in entries:
+                    if not entry.is_file() or Path(entry.name).suffix.lower() not in IMAGE_EXTENSIONS:
+                        continue
+                    seen.add(entry.name)
+                    stat = entry.stat()
+                    frame = self.frames.get(entry.name)
+                    if frame and frame["size"] == stat.st_size and frame["mtime_ns"] == stat.st_mtime_ns:
+                        continue
+                    try:
+                        self.frames[entry.name] = self._make_frame(Path(entry.path), stat, frame)
+                    except OSError as e:
+                        # Truncated or unreadable image (PIL's UnidentifiedImageError is an OSError):
+                        # left out of the manifest instead of failing the whole frame set
+                        console.log(f"⚠️ Skipping unreadable frame {entry.path}: {e}")
+                        seen.discard(entry.name)
+                        continue
+                    changed = True
+        for name in set(self.frames) - seen:
+            del self.frames[name]
+            changed = True
+        if changed:
+            self.save()
+        return changed
+
+    def add(self, path: Path, timestamp: Optional[float] = None) -> Frame:
+        """Register a single frame written into the directory."""
+        frame = self._make_frame(path, path.stat(), self.frames.get(path.name))
+        if timestamp is not None:
+            frame["timestamp"] = timestamp
+        self.frames[path.name] = frame
+        return frame
+
+    def remove(self, name: str):
+        self.frames.pop(name, None)
+
+    def set_timestamps(self, timestamps: Dict[str, float]):
+        for name, timestamp in timestamps.items():
+            if name in self.frames:
+                self.frames[name]["timestamp"] = timestamp
+
+    def save(self):
+        manifest_path = self.path_for(self.image_path)
+        tmp_path = manifest_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps({"frames": self.frames}))
+        tmp_path.replace(manifest_path)
+
+    def digest(self) -> str:
+        """Hash of the whole frame set, independent of the scan order."""
+        digest = blake2b(digest_size=16)
+        for name in self.names():
+            digest.update(f"{name}:{self.frames[name]['hash']}\n".encode())
+        return digest.hexdigest()
+
+    def names(self) -> List[str]:
+        return sorted(self.frames)
+
+    def paths(self) -> List[Path]:
+        return [self.image_path / name for name in self.names()]
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __iter__(self) -> Iterator[Frame]:
+        return (self.frames[name] for name in self.names())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.frames
+
+    def _make_frame(self, path: Path, stat: os.stat_result, previous: Optional[Frame]) -> Frame:
+        width, height = read_image_size(path)
+        return Frame(
+            name=path.name,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            width=width,
+            height=height,
+            hash=hash_file(path),
+            # Frames coming from a video keep their position in the video,
+            # uploaded frames fall back to their modification time.
+            timestamp=previous["timestamp"] if previous else stat.st_mtime,
+        )
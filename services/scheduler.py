@@ -0,0 +1,131 @@
+from contextlib import contextmanager
+import itertools
+import threading
+from typing import Callable, Dict, Iterator, List, Optional
+from rich.console import Console
+
+console = Console()
+
+class _Request:
+    def __init__(self, session_id: str, priority: int, seq: int):
+        self.session_id = session_id
+        self.priority = priority
+        self.seq = seq
+        self.device: Optional[int] = None
+
+class TrainingScheduler:
+    """
+    Hand out training slots on `devices` GPUs, `slots_per_device` jobs each.
+
+    Waiting requests are served by priority (lower first), then fairly between
+    sessions: the session holding the fewest slots goes first, then the one
+    served least since it started queueing, so one session submitting many runs
+    cannot starve the others. Ties keep submission order.
+    Devices are virtual indices, exported to the trainer as CUDA_VISIBLE_DEVICES.
+    """
+
+    def __init__(self, devices: int = 1, slots_per_device: int = 1):
+        if devices < 1 or slots_per_device < 1:
+            raise ValueError("The scheduler needs at least one device and one slot per device.")
+        self.slots_per_device = slots_per_device
+        self.busy: Dict[int, int] = {device: 0 for device in range(devices)}
+        self.running: Dict[str, int] = {}
+        self.served: Dict[str, int] = {}
+        self.pending: List[_Request] = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+
+    def _key(self, request: _Request):
+        return (
+            request.priority,
+            self.running.get(request.session_id, 0),
+            self.served.get(request.session_id, 0),
+            request.seq,
+        )
+
+    def _free_device(self) -> Optional[int]:
+        device = min(self.busy, key=self.busy.get)
+        return device if self.busy[device] < self.slots_per_device else None
+
+    def _dispatch(self):
+        # Called with the condition held: grant free slots to the best waiting requests
+        while self.pending:
+            device = self._free_device()
+            if device is None:
+                return
+            request = min(self.pending, key=self._key)
+            self.pending.remove(request)
+            request.device = device
+            self.busy[device] += 1
+            self.running[request.session_id] = self.running.get(request.session_id, 0) + 1
+            self.served[request.session_id] = self.served.get(request.session_id, 0) + 1
+        self.condition.notify_all()
+
+    def _position(self, request: _Request) -> int:
+        key = self._key(request)
+        return sum(1 for other in self.pending if self._key(other) < key)
+
+    def position(self, session_id: str) -> Optional[int]:
+        """Queue position of the first waiting request of `session_id` (0 = next), None if not waiting."""
+        with self.condition:
+            positions = [self._position(request) for request in self.pending if request.session_id == session_id]
+            return min(positions) if positions else None
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                "devices": dict(self.busy),
+                "slots_per_device": self.slots_per_device,
+                "running": dict(self.running),
+                "waiting": len(self.pending),
+            }
+
+    @contextmanager
+    def slot(
+            self,
+            session_id: str,
+            priority: int = 0,
+            on_wait: Optional[Callable[[int], None]] = None,
+            poll_interval: float = 1.0
+        ) -> Iterator[int]:
+        """
+        Block until a slot is granted to `session_id` and yield its device.
+
+        While waiting, `on_wait` is called with the queue position whenever it
+        changes. The slot is released when the block exits, even on error.
+        """
+        with self.condition:
+            request = _Request(session_id, priority, next(self.counter))
+            self.pending.append(request)
+            self._dispatch()
+            last_position = None
+            try:
+                while request.device is None:
+                    position = self._position(request)
+                    if on_wait and position != last_position:
+                        on_wait(position)
+                        last_position = position
+                    self.condition.wait(poll_interval)
+            except BaseException:
+                if request.device is None:
+                    self.pending.remove(request)
+                    raise
+                self._release(request)
+                raise
+        console.log(f"🎟️  Session {session_id} got a slot on device {request.device}")
+        try:
+            yield request.device
+        finally:
+            with self.condition:
+                self._release(request)
+
+    def _release(self, request: _Request):
+        self.busy[request.device] -= 1
+        self.running[request.session_id] -= 1
+        if not self.running[request.session_id]:
+            del self.running[request.session_id]
+            # An idle session starts over with a clean share
+            if not any(other.session_id == request.session_id for other in self.pending):
+                del self.served[request.session_id]
+        self._dispatch()
+        self.condition.notify_all()
@@ -0,0 +1,271 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from rich.console import Console
+
+console = Console()
+
+# Zeroth order spherical harmonic, maps the DC coefficient to a color
+SH_C0 = 0.28209479177387814
+
+PLY_TYPES = {
+    "char": "i1", "int8": "i1",
+    "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2",
+    "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4",
+    "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4",
+    "double": "f8", "float64": "f8",
+}
+PLY_NAMES = {"i1": "char", "u1": "uchar", "i2": "short", "u2": "ushort", "i4": "int", "u4": "uint", "f4": "float", "f8": "double"}
+
+# antimatter15/splat row: position, scale, RGBA color and rotation
+SPLAT_DTYPE = np.dtype([
+    ("position", "<f4", 3),
+    ("scale", "<f4", 3),
+    ("color", "u1", 4),
+    ("rotation", "u1", 4),
+])
+
+class InvalidPly(Exception):
+    pass
+
+def read_ply(path: Path, mmap: bool = True) -> np.ndarray:
+    """
+    Read the vertex element of a binary little endian PLY file as a structured
+    array, memory-mapped by default so that only the touched columns are read.
+    """
+    with path.open("rb") as fid:
+        if fid.readline().strip() != b"ply":
+            raise InvalidPly(f"{path} is not a PLY file.")
+        fields = []
+        count = None
+        element = None
+        while True:
+            line = fid.readline()
+            if not line:
+                raise InvalidPly(f"{path} has no end_header.")
+            words = line.decode("ascii").split()
+            if not words or words[0] in ("comment", "obj_info"):
+                continue
+            if words[0] == "format" and words[1] != "binary_little_endian":
+                raise InvalidPly(f"Unsupported PLY format {words[1]} in {path}.")
+            elif words[0] == "element":
+                element = words[1]
+                if element == "vertex":
+                    count = int(words[2])
+            elif words[0] == "property" and element == "vertex":
+                if words[1] == "list":
+                    raise InvalidPly(f"List properties are not supported for vertices in {path}.")
+                fields.append((words[2], "<" + PLY_TYPES[words[1]]))
+            elif words[0] == "end_header":
+                offset = fid.tell()
+                break
+    if count is None:
+        raise InvalidPly(f"{path} has no vertex element.")
+    dtype = np.dtype(fields)
+    if mmap:
+        return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+    return np.fromfile(path, dtype=dtype, count=count, offset=offset)
+
+def write_ply(path: Path, vertices: np.ndarray, chunk_size: int = 1 << 20):
+    """Write a structured array as the vertex element of a binary little endian PLY file."""
+    header = ["ply", "format binary_little_endian 1.0", f"element vertex {len(vertices)}"]
+    for name in vertices.dtype.names:
+        field = vertices.dtype.fields[name][0]
+        header.append(f"property {PLY_NAMES[field.base.str.lstrip('<|')]} {name}")
+    header.append("end_header")
+    dtype = vertices.dtype.newbyteorder("<")
+    with path.open("wb") as fid:
+        fid.write(("\n".join(header) + "\n").encode("ascii"))
+        for start in range(0, len(vertices), chunk_size):
+            np.asarray(vertices[start:start + chunk_size], dtype=dtype).tofile(fid)
+
+def sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-x))
+
+def splat_importance(vertices: np.ndarray) -> np.ndarray:
+    """Volume times opacity, the order in which the web viewer wants the splats."""
+    return np.exp(
+        vertices["scale_0"].astype(np.float32) + vertices["scale_1"] + vertices["scale_2"]
+    ) * sigmoid(vertices["opacity"].astype(np.float32))
+
+def to_splat(vertices: np.ndarray) -> np.ndarray:
+    """Convert Gaussian splat PLY vertices into rows of the compact .splat format."""
+    rows = np.empty(len(vertices), dtype=SPLAT_DTYPE)
+    rows["position"] = np.stack([vertices["x"], vertices["y"], vertices["z"]], axis=-1)
+    rows["scale"] = np.exp(np.stack([vertices["scale_0"], vertices["scale_1"], vertices["scale_2"]], axis=-1))
+    color = np.stack([
+        0.5 + SH_C0 * vertices["f_dc_0"],
+        0.5 + SH_C0 * vertices["f_dc_1"],
+        0.5 + SH_C0 * vertices["f_dc_2"],
+        sigmoid(vertices["opacity"].astype(np.float32)),
+    ], axis=-1)
+    rows["color"] = np.clip(color * 255, 0, 255).astype(np.uint8)
+    rotation = np.stack([vertices["rot_0"], vertices["rot_1"], vertices["rot_2"], vertices["rot_3"]], axis=-1)
+    rotation = rotation / np.maximum(np.linalg.norm(rotation, axis=-1, keepdims=True), 1e-12)
+    rows["rotation"] = np.clip(rotation * 128 + 128, 0, 255).astype(np.uint8)
+    return rows
+
+def export_splat(
+        ply_path: Path,
+        splat_path: Optional[Path] = None,
+        chunk_size: int = 1 << 20
+    ) -> dict:
+    """
+    Export a trained Gaussian splat PLY to the antimatter15 `.splat` format:
+    splats sorted by importance, colors/opacity and rotations quantized to
+    bytes and the higher order spherical harmonics dropped (32 bytes per
+    splat). Positions and scales stay float32 as the viewer expects them.
+
+    Return the number of splats, both file sizes and the compression ratio.
+    """
+    splat_path = splat_path if splat_path else ply_path.with_suffix(".splat")
+    vertices = read_ply(ply_path)
+    order = np.argsort(-splat_importance(vertices), kind="stable")
+
+    tmp_path = splat_path.with_name(f".{splat_path.name}.tmp")
+    with tmp_path.open("wb") as fid:
+        for start in range(0, len(order), chunk_size):
+            # Sorting the chunk indices keeps the memory-mapped reads sequential
+            indices = order[start:start + chunk_size]
+            sorted_indices = np.sort(indices)
+            rows = to_splat(vertices[sorted_indices])
+            rows[np.searchsorted(sorted_indices, indices)].tofile(fid)
+    tmp_path.replace(splat_path)
+
+    report = {
+        "splats": len(order),
+        "ply_bytes": ply_path.stat().st_size,
+        "splat_bytes": splat_path.stat().st_size,
+    }
+    report["ratio"] = report["ply_bytes"] / max(report["splat_bytes"], 1)
+    console.log(
+        f"🗜️  Exported {report['splats']} splats to {splat_path} "
+        f"({report['ply_bytes'] / 1e6:.1f} MB -> {report['splat_bytes'] / 1e6:.1f} MB, x{report['ratio']:.1f})"
+    )
+    return report
+
+def sh_degree(vertices: np.ndarray) -> int:
+    rest = sum(1 for name in vertices.dtype.names if name.startswith("f_rest_"))
+    return int(round(np.sqrt(rest // 3 + 1))) - 1
+
+def truncate_sh(vertices: np.ndarray, degree: int) -> np.ndarray:
+    """
+    Drop the spherical harmonics above `degree`. The `f_rest_*` coefficients
+    are stored channel-major (all of red, then green, then blue), so each
+    channel keeps its first (degree + 1)^2 - 1 coefficients.
+    """
+    current = sh_degree(vertices)
+    if degree >= current:
+        return vertices
+    per_channel = (current + 1) ** 2 - 1
+    kept = (degree + 1) ** 2 - 1
+    rest = {f"f_rest_{channel * per_channel + k}": f"f_rest_{channel * kept + k}" for channel in range(3) for k in range(kept)}
+    names = [name for name in vertices.dtype.names if not name.startswith("f_rest_") or name in rest]
+    truncated = np.empty(len(vertices), dtype=[(rest.get(name, name), vertices.dtype.fields[name][0]) for name in names])
+    for name in names:
+        truncated[rest.get(name, name)] = vertices[name]
+    return truncated
+
+@lru_cache(maxsize=4)
+def load_views(sparse_path: Path) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return the world to camera rotations (M, 3, 3), translations (M, 3),
+    pinhole intrinsics (M, 4) as fx, fy, cx, cy and image sizes (M, 2) of
+    every registered image of a COLMAP model.
+    """
+    from services.cameras import qvecs_to_rotmats, read_intrinsics, read_poses
+    poses = read_poses(sparse_path)
+    camera = read_intrinsics(sparse_path, poses["camera_ids"])
+    intrinsics = np.stack([camera["fx"], camera["fy"], camera["cx"], camera["cy"]], axis=-1)
+    sizes = np.stack([camera["width"], camera["height"]], axis=-1).astype(np.float64)
+    return qvecs_to_rotmats(poses["qvecs"]), poses["tvecs"], intrinsics, sizes
+
+def count_views(positions: np.ndarray, views: tuple, chunk_size: Optional[int] = None) -> np.ndarray:
+    """Number of cameras in which each position projects inside the image, in front of the camera."""
+    rotations, translations, intrinsics, sizes = views
+    # Keep the (cameras, points, 3) intermediate around 2^24 values
+    chunk_size = chunk_size if chunk_size else max(1, (1 << 24) // (3 * len(rotations)))
+    counts = np.zeros(len(positions), dtype=np.int32)
+    for start in range(0, len(positions), chunk_size):
+        points = np.asarray(positions[start:start + chunk_size], dtype=np.float64)
+        camera_points = np.einsum("mij,nj->mni", rotations, points) + translations[:, None, :]
+        depth = camera_points[..., 2]
+        safe_depth = np.where(depth > 1e-6, depth, 1.0)
+        u = intrinsics[:, None, 0] * camera_points[..., 0] / safe_depth + intrinsics[:, None, 2]
+        v = intrinsics[:, None, 1] * camera_points[..., 1] / safe_depth + intrinsics[:, None, 3]
+        visible = (depth > 1e-6) & (u >= 0) & (v >= 0) & (u < sizes[:, None, 0]) & (v < sizes[:, None, 1])
+        counts[start:start + chunk_size] = visible.sum(axis=0)
+    return counts
+
+def _prune_chunk(
+        ply_path: Path,
+        start: int,
+        stop: int,
+        min_opacity: float,
+        min_scale: Optional[float],
+        min_views: int,
+        sparse_path: Optional[Path]
+    ) -> np.ndarray:
+    vertices = read_ply(ply_path)[start:stop]
+    keep = sigmoid(vertices["opacity"].astype(np.float32)) >= min_opacity
+    if min_scale is not None:
+        largest = np.maximum(np.maximum(vertices["scale_0"], vertices["scale_1"]), vertices["scale_2"])
+        keep &= np.exp(largest.astype(np.float32)) >= min_scale
+    if sparse_path is not None and min_views > 0:
+        positions = np.stack([vertices["x"], vertices["y"], vertices["z"]], axis=-1)
+        keep[keep] = count_views(positions[keep], load_views(sparse_path)) >= min_views
+    return keep
+
+def prune_gaussians(
+        ply_path: Path,
+        output_path: Path,
+        min_opacity: float = 1 / 255,
+        min_scale: Optional[float] = None,
+        min_views: int = 1,
+        sparse_path: Optional[Path] = None,
+        degree: Optional[int] = None,
+        chunk_size: int = 1 << 18,
+        workers: Optional[int] = None
+    ) -> dict:
+    """
+    Write a slimmer copy of a trained splat PLY: Gaussians that are nearly
+    transparent (opacity below `min_opacity`), tiny (largest scale below
+    `min_scale`) or seen by fewer than `min_views` cameras of `sparse_path`
+    are removed, and the spherical harmonics are truncated to `degree`.
+
+    The masks are computed on chunks of the memory-mapped PLY in a process
+    pool. Return the Gaussian count and file size before and after.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    vertices = read_ply(ply_path)
+    bounds = [(start, min(start + chunk_size, len(vertices))) for start in range(0, len(vertices), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        masks = list(executor.map(
+            _prune_chunk,
+            *zip(*[(ply_path, start, stop, min_opacity, min_scale, min_views, sparse_path) for start, stop in bounds])
+        ))
+    keep = np.concatenate(masks) if masks else np.zeros(0, dtype=bool)
+
+    pruned = vertices[keep]
+    if degree is not None:
+        pruned = truncate_sh(pruned, degree)
+    write_ply(output_path, pruned)
+
+    report = {
+        "gaussians_before": len(vertices),
+        "gaussians_after": len(pruned),
+        "bytes_before": ply_path.stat().st_size,
+        "bytes_after": output_path.stat().st_size,
+        "sh_degree": sh_degree(pruned),
+    }
+    console.log(
+        f"✂️  Pruned {report['gaussians_before']} -> {report['gaussians_after']} Gaussians, "
+        f"{report['bytes_before'] / 1e6:.1f} MB -> {report['bytes_after'] / 1e6:.1f} MB (SH degree {report['sh_degree']})"
+    )
+    return report
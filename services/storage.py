@@ -0,0 +1,216 @@
+import os
+from pathlib import Path
+import shutil
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Protocol, Set
+import uuid
+from typing_extensions import TypedDict
+from rich.console import Console
+
+console = Console()
+
+# Touched on every use of a session, its mtime is the last access time
+ACCESS_FILE = ".last_access"
+
+SessionUsage = TypedDict("SessionUsage", {
+    "bytes": int,
+    "files": int,
+    "last_access": float,
+})
+
+class QuotaExceeded(Exception):
+    pass
+
+class Cache(Protocol):
+    """What the janitor needs from a cache kept under the same disk budget."""
+
+    def stats(self) -> dict: ...
+
+    def evict(self): ...
+
+def is_session_dir(path: Path) -> bool:
+    try:
+        return path.is_dir() and str(uuid.UUID(path.name)) == path.name
+    except ValueError:
+        return False
+
+def touch_session(session_path: Path):
+    (session_path / ACCESS_FILE).touch()
+
+def session_usage(session_path: Path) -> SessionUsage:
+    """
+    Bytes on disk of a session, in a single walk. Symlinks are not followed
+    and hardlinked files (shared with the caches) are only counted once.
+    """
+    seen = set()
+    total, files = 0, 0
+    last_access = None
+    stack = [session_path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_symlink():
+                    continue
+                if entry.is_dir():
+                    stack.append(Path(entry.path))
+                    continue
+                stat = entry.stat()
+                if entry.name == ACCESS_FILE and entry.path == str(session_path / ACCESS_FILE):
+                    last_access = stat.st_mtime
+                if (stat.st_dev, stat.st_ino) in seen:
+                    continue
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_blocks * 512
+                files += 1
+    # Sessions never touched fall back to the directory modification time
+    if last_access is None:
+        last_access = session_path.stat().st_mtime
+    return SessionUsage(bytes=total, files=files, last_access=last_access)
+
+class StorageManager:
+    """
+    Keep the sessions under `root_path` and the `caches` next to them within
+    their disk budget.
+
+    A background janitor removes sessions idle for more than `ttl` seconds and
+    trims every cache to its own bound, then evicts the least recently used
+    idle sessions while the total of sessions and caches is above `max_bytes`. Sessions for which `is_busy(session_id)` is true, or used in
+    the last `min_idle` seconds (uploads in progress), are never touched.
+    `check_quota` refuses new work for a session above `max_session_bytes`.
+    """
+
+    def __init__(
+            self,
+            root_path: Path,
+            max_bytes: int,
+            max_session_bytes: int,
+            ttl: float,
+            is_busy: Callable[[str], bool] = lambda session_id: False,
+            caches: Iterable[Cache] = (),
+            interval: float = 300.0,
+            min_idle: float = 600.0
+        ):
+        self.root_path = root_path
+        self.max_bytes = max_bytes
+        self.max_session_bytes = max_session_bytes
+        self.ttl = ttl
+        self.is_busy = is_busy
+        self.caches = list(caches)
+        self.interval = interval
+        self.min_idle = min_idle
+        self.usage: Dict[str, SessionUsage] = {}
+        self.cache_bytes = 0
+        self.evicted = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def scan(self) -> Dict[str, SessionUsage]:
+        usage = {}
+        for path in self.root_path.iterdir():
+            if not is_session_dir(path):
+                continue
+            try:
+                usage[path.name] = session_usage(path)
+            except FileNotFoundError:
+                # Removed while being scanned
+                continue
+        with self.lock:
+            self.usage = usage
+        return usage
+
+    def check_quota(self, session_id: str, reserved: int = 0):
+        """Raise `QuotaExceeded` if the session, plus `reserved` bytes still to be written, is above its quota."""
+        usage = session_usage(self.root_path / session_id)
+        with self.lock:
+            self.usage[session_id] = usage
+        if usage["bytes"] + reserved > self.max_session_bytes:
+            raise QuotaExceeded(
+                f"Session {session_id} uses {usage['bytes'] / 1e9:.1f} GB with {reserved / 1e9:.1f} GB to come, "
+                f"above its {self.max_session_bytes / 1e9:.1f} GB quota."
+            )
+
+    def remaining_quota(self, session_id: str) -> int:
+        """Bytes the session can still write before reaching its quota."""
+        usage = session_usage(self.root_path / session_id)
+        with self.lock:
+            self.usage[session_id] = usage
+        return max(0, self.max_session_bytes - usage["bytes"])
+
+    def remove(self, session_id: str):
+        shutil.rmtree(self.root_path / session_id, ignore_errors=True)
+        with self.lock:
+            self.usage.pop(session_id, None)
+        self.evicted += 1
+
+    def scan_caches(self) -> int:
+        """Trim every cache to its own bound and return the bytes they still use."""
+        total = 0
+        for cache in self.caches:
+            cache.evict()
+            total += cache.stats()["bytes"]
+        with self.lock:
+            self.cache_bytes = total
+        return total
+
+    def collect(self, now: Optional[float] = None) -> Set[str]:
+        """Remove expired sessions, then LRU sessions above the global quota. Return the removed ids."""
+        now = now if now is not None else time.time()
+        usage = self.scan()
+        cache_bytes = self.scan_caches()
+        removed = set()
+        # Least recently used first
+        for session_id, session in sorted(usage.items(), key=lambda item: item[1]["last_access"]):
+            if now - session["last_access"] > self.ttl and not self.is_busy(session_id):
+                removed.add(session_id)
+        # Files linked from the caches into sessions are counted twice: the total errs on the safe side
+        total = cache_bytes + sum(session["bytes"] for session_id, session in usage.items() if session_id not in removed)
+        for session_id, session in sorted(usage.items(), key=lambda item: item[1]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if session_id in removed or now - session["last_access"] < self.min_idle or self.is_busy(session_id):
+                continue
+            removed.add(session_id)
+            total -= session["bytes"]
+        for session_id in removed:
+            console.log(f"🧹 Removing session {session_id} ({usage[session_id]['bytes'] / 1e6:.0f} MB)")
+            self.remove(session_id)
+        if total > self.max_bytes:
+            console.log(f"⚠️ Sessions and caches use {total / 1e9:.1f} GB above the {self.max_bytes / 1e9:.1f} GB quota, all busy")
+        return removed
+
+    def stats(self) -> dict:
+        """Aggregate usage only: session ids are the only credential of a session, never list them."""
+        with self.lock:
+            usage = dict(self.usage)
+            cache_bytes = self.cache_bytes
+        disk = shutil.disk_usage(self.root_path)
+        return {
+            "sessions": len(usage),
+            "bytes": sum(session["bytes"] for session in usage.values()),
+            "cache_bytes": cache_bytes,
+            "max_bytes": self.max_bytes,
+            "max_session_bytes": self.max_session_bytes,
+            "ttl": self.ttl,
+            "evicted": self.evicted,
+            "disk": {"total": disk.total, "used": disk.used, "free": disk.free},
+        }
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.collect()
+            except Exception as e:
+                console.log(f"🚨 Storage janitor failed: {e}")
+
+    def start(self):
+        self.scan()
+        self.scan_caches()
+        self.thread = threading.Thread(target=self._run, name="storage-janitor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
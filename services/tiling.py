@@ -0,0 +1,110 @@
+import json
+from pathlib import Path
+import shutil
+from typing import Sequence
+import numpy as np
+from rich.console import Console
+from services.splat import SPLAT_DTYPE, read_ply, splat_importance, to_splat
+
+console = Console()
+
+def morton_codes(cells: np.ndarray, depth: int) -> np.ndarray:
+    """Interleave the bits of (N, 3) integer grid cells into (N,) octree codes, x being the highest bit."""
+    cells = cells.astype(np.uint64)
+    codes = np.zeros(len(cells), dtype=np.uint64)
+    for bit in range(depth):
+        for axis in range(3):
+            codes |= ((cells[:, axis] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(3 * bit + 2 - axis)
+    return codes
+
+def build_octree(codes: np.ndarray, max_splats: int, max_depth: int) -> list[tuple[str, int, int]]:
+    """
+    Split splats sorted by `codes` into octree leaves of at most `max_splats`
+    (unless `max_depth` is reached). Return (tile id, start, stop) ranges of
+    the sorted array, the tile id being the path of octants from the root "r".
+    """
+    leaves = []
+    stack = [("r", 0, 0, len(codes))]
+    while stack:
+        tile_id, depth, start, stop = stack.pop()
+        if stop - start <= max_splats or depth == max_depth:
+            leaves.append((tile_id, start, stop))
+            continue
+        shift = np.uint64(3 * (max_depth - depth - 1))
+        prefix = int(codes[start]) >> (3 * (max_depth - depth))
+        # Children are contiguous in the sorted codes: split the range on their boundaries
+        bounds = np.searchsorted(
+            codes[start:stop],
+            np.array([(prefix * 8 + octant) for octant in range(9)], dtype=np.uint64) << shift,
+        ) + start
+        for octant in reversed(range(8)):
+            if bounds[octant] < bounds[octant + 1]:
+                stack.append((f"{tile_id}{octant}", depth + 1, int(bounds[octant]), int(bounds[octant + 1])))
+    return sorted(leaves, key=lambda leaf: (len(leaf[0]), leaf[0]))
+
+def build_tiles(
+        ply_path: Path,
+        output_path: Path,
+        max_splats: int = 65_536,
+        max_depth: int = 10,
+        lod_fractions: Sequence[float] = (1 / 16, 1 / 4, 1),
+        outlier_quantile: float = 0.001
+    ) -> dict:
+    """
+    Split a trained Gaussian splat PLY into an octree of `.splat` tiles for
+    progressive loading, described by `output_path/index.json`.
+
+    Each tile stores its splats by decreasing importance, so any prefix of the
+    file is a coarse version of the tile: the index lists, for every LOD in
+    `lod_fractions`, how many leading bytes to fetch with an HTTP range
+    request. The octree grid ignores the `outlier_quantile` extremes (floaters)
+    on each axis, which are clamped into the border tiles.
+    """
+    vertices = read_ply(ply_path)
+    positions = np.stack([vertices["x"], vertices["y"], vertices["z"]], axis=-1).astype(np.float32)
+    importance = splat_importance(vertices)
+
+    low, high = np.quantile(positions, [outlier_quantile, 1 - outlier_quantile], axis=0)
+    resolution = 1 << max_depth
+    cells = np.clip((positions - low) / np.maximum(high - low, 1e-9) * resolution, 0, resolution - 1)
+    codes = morton_codes(cells.astype(np.uint32), max_depth)
+    order = np.argsort(codes, kind="stable")
+    codes = codes[order]
+    leaves = build_octree(codes, max_splats, max_depth)
+
+    # Build next to the destination and swap, so a viewer never sees a half written set
+    tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    tiles = []
+    for tile_id, start, stop in leaves:
+        indices = order[start:stop]
+        indices = indices[np.argsort(-importance[indices], kind="stable")]
+        # Sorted reads keep the memory-mapped PLY access sequential
+        sorted_indices = np.sort(indices)
+        rows = to_splat(vertices[sorted_indices])[np.searchsorted(sorted_indices, indices)]
+        rows.tofile(tmp_path / f"{tile_id}.splat")
+        counts = sorted({max(1, int(np.ceil(len(rows) * fraction))) for fraction in lod_fractions})
+        tiles.append({
+            "id": tile_id,
+            "file": f"{tile_id}.splat",
+            "depth": len(tile_id) - 1,
+            "count": len(rows),
+            "bounds": [rows["position"].min(axis=0).tolist(), rows["position"].max(axis=0).tolist()],
+            "lod": [{"count": count, "bytes": count * SPLAT_DTYPE.itemsize} for count in counts],
+        })
+
+    index = {
+        "version": 1,
+        "format": "splat",
+        "bytes_per_splat": SPLAT_DTYPE.itemsize,
+        "splats": len(order),
+        "bounds": [positions.min(axis=0).tolist(), positions.max(axis=0).tolist()],
+        "lod_fractions": list(lod_fractions),
+        "tiles": tiles,
+    }
+    (tmp_path / "index.json").write_text(json.dumps(index))
+    shutil.rmtree(output_path, ignore_errors=True)
+    tmp_path.replace(output_path)
+    console.log(f"🧱 Split {len(order)} splats into {len(tiles)} tiles. Path: {output_path}")
+    return index
@@ -0,0 +1,114 @@
+import json
+from pathlib import Path
+import re
+import time
+from typing import Optional
+
+ITERATION_PATTERN = re.compile(r"iter(?:ation)?s?\W*(\d+)", re.IGNORECASE)
+LOSS_PATTERN = re.compile(r"loss\W*([-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)", re.IGNORECASE)
+CONVERGENCE_PATTERN = re.compile(
+    r"(?:\bcr\b|convergence[ _]rate)\W*([-+]?\d*\.?\d+(?:[eE][-+]?\d+)?)", re.IGNORECASE
+)
+
+def parse_training_line(line: str) -> Optional[tuple[int, Optional[float], Optional[float]]]:
+    """Extract (iteration, loss, convergence rate) from a trainer output line, if any."""
+    iteration = ITERATION_PATTERN.search(line)
+    loss = LOSS_PATTERN.search(line)
+    convergence = CONVERGENCE_PATTERN.search(line)
+    if iteration is None or (loss is None and convergence is None):
+        return None
+    return (
+        int(iteration.group(1)),
+        float(loss.group(1)) if loss else None,
+        float(convergence.group(1)) if convergence else None,
+    )
+
+class TrainingMetrics:
+    """
+    Compact time series of the trainer loss and convergence rate.
+
+    When `max_points` samples are stored, every other sample is dropped and
+    only one sample out of `stride` is recorded from then on, so a run of any
+    length stays within `max_points` while covering the whole training.
+    The series is flushed to `metrics_path` at most every `flush_interval` seconds.
+    """
+
+    def __init__(self, metrics_path: Optional[Path] = None, max_points: int = 2_000, flush_interval: float = 5.0):
+        self.metrics_path = metrics_path
+        self.max_points = max_points
+        self.flush_interval = flush_interval
+        self.iterations: list[int] = []
+        self.loss: list[Optional[float]] = []
+        self.convergence_rate: list[Optional[float]] = []
+        self.stride = 1
+        self.seen = 0
+        self.flushed = 0.0
+        self.stopped_reason: Optional[str] = None
+
+    def add(self, iteration: int, loss: Optional[float], convergence_rate: Optional[float]):
+        self.seen += 1
+        if (self.seen - 1) % self.stride == 0:
+            self.iterations.append(iteration)
+            self.loss.append(loss)
+            self.convergence_rate.append(convergence_rate)
+            if len(self.iterations) >= self.max_points:
+                self.iterations = self.iterations[::2]
+                self.loss = self.loss[::2]
+                self.convergence_rate = self.convergence_rate[::2]
+                self.stride *= 2
+        if time.monotonic() - self.flushed > self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.flushed = time.monotonic()
+        if self.metrics_path is None:
+            return
+        tmp_path = self.metrics_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({
+            "iterations": self.iterations,
+            "loss": self.loss,
+            "convergence_rate": self.convergence_rate,
+            "stopped_reason": self.stopped_reason,
+        }))
+        tmp_path.replace(self.metrics_path)
+
+class EarlyStopPolicy:
+    """
+    Decide when a training run has plateaued.
+
+    The loss is smoothed with an exponential moving average; the run stops
+    once it has not improved by more than `min_delta` (relative) for
+    `patience` iterations, or once the trainer's average convergence rate
+    drops below `convergence_rate`. Nothing stops before `min_iterations`.
+    """
+
+    def __init__(
+            self,
+            min_iterations: int = 7_000,
+            patience: int = 2_000,
+            min_delta: float = 0.001,
+            convergence_rate: Optional[float] = None,
+            smoothing: float = 0.98
+        ):
+        self.min_iterations = min_iterations
+        self.patience = patience
+        self.min_delta = min_delta
+        self.convergence_rate = convergence_rate
+        self.smoothing = smoothing
+        self.smoothed: Optional[float] = None
+        self.best: Optional[float] = None
+        self.best_iteration = 0
+
+    def update(self, iteration: int, loss: Optional[float], convergence_rate: Optional[float]) -> Optional[str]:
+        """Feed a new sample, return the reason to stop or None to keep training."""
+        if loss is not None:
+            self.smoothed = loss if self.smoothed is None else self.smoothing * self.smoothed + (1 - self.smoothing) * loss
+            if self.best is None or self.smoothed < self.best * (1 - self.min_delta):
+                self.best, self.best_iteration = self.smoothed, iteration
+        if iteration < self.min_iterations:
+            return None
+        if self.convergence_rate is not None and convergence_rate is not None and convergence_rate < self.convergence_rate:
+            return f"convergence rate {convergence_rate:.5f} below {self.convergence_rate} at iteration {iteration}"
+        if self.best is not None and iteration - self.best_iteration >= self.patience:
+            return f"loss plateaued since iteration {self.best_iteration} (checked at iteration {iteration})"
+        return None
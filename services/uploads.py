@@ -0,0 +1,183 @@
+from hashlib import sha256
+import json
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Dict, List, Optional
+import uuid
+from typing_extensions import TypedDict
+from rich.console import Console
+
+console = Console()
+
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".mkv", ".avi", ".webm", ".m4v"}
+
+Upload = TypedDict("Upload", {
+    "id": str,
+    "session_id": str,
+    "filename": str,
+    "size": int,
+    "offset": int,
+    "created_at": float,
+    "updated_at": float,
+    "path": Optional[str],
+    "params": dict,
+})
+
+class InvalidUpload(Exception):
+    pass
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset: int):
+        super().__init__(f"The upload continues at offset {offset}.")
+        self.offset = offset
+
+class ChecksumMismatch(Exception):
+    pass
+
+class TooManyUploads(Exception):
+    pass
+
+class UploadStore:
+    """
+    Resumable chunked uploads written straight into the session directories.
+
+    An upload lives in `<session>/uploads/<id>.part`, written with positional
+    writes, next to a JSON record of its committed offset. A chunk only moves
+    the offset once its SHA-256 matched, so a client resumes from the last
+    verified byte after any failure. The completed file is renamed into the
+    session (same filesystem, no copy). A session holds at most `max_open`
+    incomplete uploads.
+    """
+
+    def __init__(self, root_path: Path, max_size: int, max_chunk_size: int = 64 << 20, max_open: int = 2):
+        self.root_path = root_path
+        self.max_size = max_size
+        self.max_chunk_size = max_chunk_size
+        self.max_open = max_open
+        self.locks: Dict[str, threading.Lock] = {}
+        self.locks_lock = threading.Lock()
+
+    def _paths(self, session_id: str, upload_id: str) -> tuple[Path, Path]:
+        uploads_path = self.root_path / session_id / "uploads"
+        return uploads_path / f"{upload_id}.json", uploads_path / f"{upload_id}.part"
+
+    def _lock(self, upload_id: str) -> threading.Lock:
+        with self.locks_lock:
+            return self.locks.setdefault(upload_id, threading.Lock())
+
+    def _save(self, upload: Upload):
+        record_path, _ = self._paths(upload["session_id"], upload["id"])
+        tmp_path = record_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(upload))
+        tmp_path.replace(record_path)
+
+    def create(self, session_id: str, filename: str, size: int, params: Optional[dict] = None) -> Upload:
+        suffix = Path(filename).suffix.lower()
+        if suffix not in VIDEO_EXTENSIONS:
+            raise InvalidUpload(f"Unsupported file type {suffix}, expected one of {sorted(VIDEO_EXTENSIONS)}.")
+        if not 0 < size <= self.max_size:
+            raise InvalidUpload(f"The upload size must be between 1 byte and {self.max_size} bytes.")
+        if len(self.open_uploads(session_id)) >= self.max_open:
+            raise TooManyUploads(f"Session {session_id} already has {self.max_open} uploads in progress.")
+        upload = Upload(
+            id=str(uuid.uuid4()),
+            session_id=session_id,
+            filename=Path(filename).name,
+            size=size,
+            offset=0,
+            created_at=time.time(),
+            updated_at=time.time(),
+            path=None,
+            params=params or {},
+        )
+        record_path, part_path = self._paths(session_id, upload["id"])
+        record_path.parent.mkdir(parents=True, exist_ok=True)
+        with part_path.open("wb") as fid:
+            # Reserve the size up front, chunks are written at their offset
+            fid.truncate(size)
+        self._save(upload)
+        return upload
+
+    def get(self, session_id: str, upload_id: str) -> Optional[Upload]:
+        record_path, _ = self._paths(session_id, upload_id)
+        if not record_path.exists():
+            return None
+        return Upload(**json.loads(record_path.read_text()))
+
+    def open_uploads(self, session_id: str) -> List[Upload]:
+        uploads_path = self.root_path / session_id / "uploads"
+        if not uploads_path.exists():
+            return []
+        uploads = [Upload(**json.loads(path.read_text())) for path in uploads_path.glob("*.json")]
+        return [upload for upload in uploads if upload["path"] is None]
+
+    def pending_bytes(self, session_id: str) -> int:
+        """
+        Bytes the incomplete uploads of a session will still write. Their `.part`
+        files are sparse, so the disk usage only shows what was written so far.
+        """
+        return sum(upload["size"] - upload["offset"] for upload in self.open_uploads(session_id))
+
+    def open_chunk(self, upload: Upload, offset: int) -> "ChunkWriter":
+        if upload["path"] is not None:
+            raise InvalidUpload("The upload is already complete.")
+        if offset != upload["offset"]:
+            raise OffsetMismatch(upload["offset"])
+        _, part_path = self._paths(upload["session_id"], upload["id"])
+        return ChunkWriter(self, upload, part_path)
+
+    def commit(self, upload: Upload, length: int, digest: str, expected_digest: str) -> Upload:
+        """Move the offset past a written chunk if its checksum matches, complete the upload at the end."""
+        if digest != expected_digest.lower():
+            raise ChecksumMismatch(f"Chunk checksum {digest} does not match {expected_digest}.")
+        upload["offset"] += length
+        upload["updated_at"] = time.time()
+        if upload["offset"] == upload["size"]:
+            _, part_path = self._paths(upload["session_id"], upload["id"])
+            destination = self.root_path / upload["session_id"] / f"video{Path(upload['filename']).suffix.lower()}"
+            part_path.replace(destination)
+            upload["path"] = str(destination)
+            console.log(f"📥 Upload {upload['id']} complete ({upload['size'] / 1e6:.0f} MB). Path: {destination}")
+        self._save(upload)
+        return upload
+
+class ChunkWriter:
+    """Positional writes of one chunk, hashed as they arrive. Hold it with `with`: one chunk per upload at a time."""
+
+    def __init__(self, store: UploadStore, upload: Upload, part_path: Path):
+        self.store = store
+        self.upload = upload
+        self.part_path = part_path
+        self.lock = store._lock(upload["id"])
+        self.digest = sha256()
+        self.length = 0
+        self.fd = -1
+
+    def __enter__(self) -> "ChunkWriter":
+        if not self.lock.acquire(blocking=False):
+            raise OffsetMismatch(self.upload["offset"])
+        # Re-read the record under the lock, a concurrent chunk may have moved the offset
+        current = self.store.get(self.upload["session_id"], self.upload["id"])
+        if current is None or current["offset"] != self.upload["offset"] or current["path"] is not None:
+            self.lock.release()
+            raise OffsetMismatch(current["offset"] if current else 0)
+        self.fd = os.open(self.part_path, os.O_WRONLY)
+        return self
+
+    def write(self, data: bytes):
+        if self.length + len(data) > self.store.max_chunk_size or self.upload["offset"] + self.length + len(data) > self.upload["size"]:
+            raise InvalidUpload("The chunk is larger than allowed or goes past the declared size.")
+        os.pwrite(self.fd, data, self.upload["offset"] + self.length)
+        self.digest.update(data)
+        self.length += len(data)
+
+    def commit(self, expected_digest: str) -> Upload:
+        if self.upload["offset"] + self.length == self.upload["size"]:
+            os.fsync(self.fd)
+        return self.store.commit(self.upload, self.length, self.digest.hexdigest(), expected_digest)
+
+    def __exit__(self, *exc):
+        os.close(self.fd)
+        self.lock.release()
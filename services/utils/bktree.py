@@ -0,0 +1,49 @@
+from typing import Callable, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+class BKTree(Generic[T]):
+    """
+    Burkhard-Keller tree for nearest neighbour queries in a discrete metric
+    space (e.g. Hamming distance between perceptual hashes). A query within
+    `threshold` only visits the children whose edge distance lies in
+    [d - threshold, d + threshold], which keeps lookups sub-linear.
+    """
+
+    def __init__(self, distance: Callable[[T, T], int]):
+        self.distance = distance
+        self.root: Optional[Tuple[T, dict]] = None
+        self.size = 0
+
+    def add(self, item: T):
+        self.size += 1
+        if self.root is None:
+            self.root = (item, {})
+            return
+        node = self.root
+        while True:
+            value, children = node
+            distance = self.distance(item, value)
+            if distance not in children:
+                children[distance] = (item, {})
+                return
+            node = children[distance]
+
+    def find(self, item: T, threshold: int) -> List[Tuple[int, T]]:
+        """Return every (distance, item) within `threshold` of `item`."""
+        if self.root is None:
+            return []
+        matches = []
+        stack = [self.root]
+        while stack:
+            value, children = stack.pop()
+            distance = self.distance(item, value)
+            if distance <= threshold:
+                matches.append((distance, value))
+            for edge, child in children.items():
+                if distance - threshold <= edge <= distance + threshold:
+                    stack.append(child)
+        return matches
+
+    def __len__(self) -> int:
+        return self.size
@@ -0,0 +1,12 @@
+import os
+from pathlib import Path
+import shutil
+
+def link_or_copy(src: Path, dst: Path):
+    """Hard link `src` to `dst`, falling back to a copy across filesystems."""
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
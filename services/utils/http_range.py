@@ -0,0 +1,70 @@
+from pathlib import Path
+import re
+from typing import Iterator, Optional, Tuple
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)")
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `Range: bytes=start-end` header into an inclusive (start, end)
+    pair clamped to `size`. Return None when the whole file should be sent
+    (no header, or a multi-range request which is answered in full).
+    """
+    if not header or "," in header:
+        return None
+    match = RANGE_PATTERN.fullmatch(header.strip())
+    if match is None or match.groups() == ("", ""):
+        raise RangeNotSatisfiable(header)
+    start, end = match.groups()
+    if start == "":
+        # Suffix range: the last `end` bytes
+        start, end = max(0, size - int(end)), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+def _read_range(path: Path, start: int, length: int, chunk_size: int) -> Iterator[bytes]:
+    with path.open("rb") as fid:
+        fid.seek(start)
+        while length > 0:
+            chunk = fid.read(min(chunk_size, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+def range_response(
+        path: Path,
+        range_header: Optional[str],
+        media_type: str = "application/octet-stream",
+        chunk_size: int = 1 << 16
+    ) -> Response:
+    """Serve `path` in full (200) or the requested byte range (206), streamed in chunks."""
+    stat = path.stat()
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+    }
+    try:
+        byte_range = parse_range(range_header, stat.st_size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{stat.st_size}"})
+    if byte_range is None:
+        start, end, status_code = 0, stat.st_size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _read_range(path, start, end - start + 1, chunk_size),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers,
+    )
@@ -0,0 +1,39 @@
+from pathlib import Path
+
+import numpy as np
+
+def load_gray(path: Path, max_size: int = 512) -> np.ndarray:
+    """Decode an image as a float32 grayscale array with a long edge close to `max_size`."""
+    from PIL import Image
+    with Image.open(path) as image:
+        # JPEG draft mode lets libjpeg decode at 1/2, 1/4 or 1/8 scale directly
+        image.draft("L", (max_size, max_size))
+        image = image.convert("L")
+        image.thumbnail((max_size, max_size))
+        return np.asarray(image, dtype=np.float32)
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """Variance of the 4-neighbour Laplacian, higher means sharper."""
+    laplacian = (
+        gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1]
+        - 4.0 * gray[1:-1, 1:-1]
+    )
+    return float(laplacian.var())
+
+def dhash(gray: np.ndarray, hash_size: int = 8) -> int:
+    """
+    Difference hash of a grayscale image: the image is area-averaged down to
+    (hash_size, hash_size + 1) blocks and every bit tells whether a block is
+    brighter than its left neighbour.
+    """
+    gray = np.asarray(gray, dtype=np.float64)
+    height, width = gray.shape
+    rows = np.linspace(0, height, hash_size + 1).astype(int)[:-1]
+    cols = np.linspace(0, width, hash_size + 2).astype(int)[:-1]
+    blocks = np.add.reduceat(np.add.reduceat(gray, rows, axis=0), cols, axis=1)
+    blocks /= np.outer(np.diff(np.r_[rows, height]), np.diff(np.r_[cols, width]))
+    bits = blocks[:, 1:] > blocks[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
@@ -0,0 +1,20 @@
+import json
+import os
+from pathlib import Path
+import pytest
+
+FAKES_PATH = Path(__file__).parent / "fakes"
+
+@pytest.fixture
+def fake_trainer() -> str:
+    return str(FAKES_PATH / "gaussian_splatting_cuda")
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    """Put the fake ffmpeg and ffprobe first on the PATH."""
+    monkeypatch.setenv("PATH", f"{FAKES_PATH}{os.pathsep}{os.environ.get('PATH', '')}")
+
+def make_video(path: Path, **video) -> Path:
+    """A "video" for the fake ffmpeg, see tests/fakes/ffmpeg."""
+    path.write_text(json.dumps({"id": 0, "duration": 4.0, "width": 64, "height": 48, **video}))
+    return path
@@ -0,0 +1,49 @@
+from PIL import Image
+import pytest
+from conftest import make_video
+from services.cache import ArtifactCache, artifact_key
+from services.manifest import FrameManifest
+
+def make_frames(image_path, count=3):
+    image_path.mkdir(parents=True)
+    for index in range(count):
+        Image.new("RGB", (32, 24), (index, 0, 0)).save(image_path / f"{index + 1:04d}.jpg")
+
+def test_detach_keeps_the_session_files(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache", max_bytes=1 << 30)
+    session_path = tmp_path / "session"
+    make_frames(session_path / "input")
+    FrameManifest.load(session_path / "input")
+    entry_path = cache.store("ffmpeg-key", session_path, ["input", "input_manifest.json"])
+    assert (session_path / "input" / "0001.jpg").stat().st_nlink == 2
+
+    cache.detach(session_path, ["input", "input_manifest.json", "sparse"])
+
+    assert len(FrameManifest.load(session_path / "input")) == 3
+    frame = session_path / "input" / "0001.jpg"
+    assert frame.stat().st_nlink == 1
+    # Rewriting the session copy in place leaves the cache entry intact
+    cached = (entry_path / "data" / "input" / "0001.jpg").read_bytes()
+    frame.write_bytes(b"rewritten")
+    assert (entry_path / "data" / "input" / "0001.jpg").read_bytes() == cached
+
+def test_ffmpeg_then_colmap_step_on_one_session(tmp_path, fake_ffmpeg, monkeypatch):
+    server = pytest.importorskip("server")
+    import services.colmap
+    monkeypatch.setattr(server, "GS_DIR", tmp_path)
+    monkeypatch.setattr(server, "ARTIFACTS", ArtifactCache(tmp_path / "cache" / "artifacts", 1 << 30))
+    session_path = tmp_path / "0b0e7f1c-98c5-4a8e-9c57-1f1b1c4a8e11"
+    session_path.mkdir()
+    video_path = make_video(session_path / "video.mp4", id=1, duration=3.0)
+
+    def fake_colmap(source_path, **kwargs):
+        # The frames extracted (and cached) by step 1 must still be there
+        assert len(FrameManifest.load(source_path / "input")) == 3
+        (source_path / "sparse" / "0").mkdir(parents=True, exist_ok=True)
+
+    monkeypatch.setattr(services.colmap, "colmap", fake_colmap)
+    # The second pass restores the frames from the cache and misses it for COLMAP (other camera)
+    for camera in ("OPENCV", "PINHOLE"):
+        server.runFfmpegStep(session_path.name, str(video_path), 1, 1, 1, None, None, None, False)
+        server.runColmapStep(session_path.name, camera, None, None, False)
+    assert len(FrameManifest.load(session_path / "input")) == 3
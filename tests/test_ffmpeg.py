@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import numpy as np
+from PIL import Image
+import pytest
+from conftest import make_video
+from services.ffmpeg import FailedProcess, ffmpeg_run, select_keyframes
+from services.manifest import FrameManifest
+
+def test_concurrent_extractions_stay_in_their_directory(tmp_path, fake_ffmpeg, monkeypatch):
+    cwd = tmp_path / "cwd"
+    cwd.mkdir()
+    monkeypatch.chdir(cwd)
+    jobs = 8
+
+    def extract(job: int):
+        session_path = tmp_path / f"session_{job}"
+        session_path.mkdir()
+        video_path = make_video(session_path / "video.mp4", id=job + 1, duration=3.0 + job % 3)
+        # Half of the jobs decode their video as parallel segments
+        ffmpeg_run(video_path, session_path, fps=2, segments=1 + job % 2)
+        return session_path
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        session_paths = list(executor.map(extract, range(jobs)))
+
+    assert os.getcwd() == str(cwd)
+    assert list(cwd.iterdir()) == []
+    for job, session_path in enumerate(session_paths):
+        frames = sorted((session_path / "input").iterdir())
+        assert [frame.name for frame in frames] == [f"{index:04d}.jpg" for index in range(1, len(frames) + 1)]
+        assert len(frames) == 2 * (3 + job % 3)
+        for frame in frames:
+            with Image.open(frame) as image:
+                # The red channel carries the id of the job that decoded the frame
+                assert abs(image.getpixel((0, 0))[0] - (job + 1)) <= 2
+        assert len(FrameManifest.load(session_path / "input")) == len(frames)
+
+def test_streaming_filters_and_rotation(tmp_path, fake_ffmpeg):
+    # A portrait phone video: 64x48 coded, rotated by the display matrix
+    video_path = make_video(tmp_path / "video.mp4", id=7, duration=3.0, rotation=-90)
+    ffmpeg_run(video_path, tmp_path, fps=2, streaming=True, max_size=32)
+    frames = sorted((tmp_path / "input").iterdir())
+    assert len(frames) == 6
+    with Image.open(frames[0]) as image:
+        assert image.size == (24, 32)
+
+def test_streaming_drops_duplicates(tmp_path, fake_ffmpeg):
+    # The fake frames are flat: all of them share the same perceptual hash
+    video_path = make_video(tmp_path / "video.mp4", duration=3.0)
+    ffmpeg_run(video_path, tmp_path, fps=2, streaming=True, dedup_threshold=0)
+    assert [frame.name for frame in (tmp_path / "input").iterdir()] == ["0001.jpg"]
+
+def test_unknown_duration_decodes_the_whole_stream(tmp_path, fake_ffmpeg):
+    # The fake decodes 10s when the video reports no duration, unless -t cuts it
+    video_path = make_video(tmp_path / "video.mp4", duration=None)
+    ffmpeg_run(video_path, tmp_path / "frames", fps=2, segments=2)
+    assert len(list((tmp_path / "frames" / "input").iterdir())) == 20
+    ffmpeg_run(video_path, tmp_path / "streamed", fps=2, streaming=True)
+    assert len(list((tmp_path / "streamed" / "input").iterdir())) == 20
+
+@pytest.mark.parametrize("start_time, end_time, message", [
+    ("00:00:05", "00:00:02", "must come after its start"),
+    ("3", "3", "must come after its start"),
+    ("10", None, "past the end of the video"),
+    ("abc", None, "Invalid time"),
+    ("-2", None, "positive duration"),
+])
+def test_invalid_ranges_are_rejected(tmp_path, fake_ffmpeg, start_time, end_time, message):
+    video_path = make_video(tmp_path / "video.mp4", duration=4.0)
+    for segments in (1, 3):
+        with pytest.raises(FailedProcess, match=message):
+            ffmpeg_run(video_path, tmp_path, start_time=start_time, end_time=end_time, segments=segments)
+
+def test_keyframes_follow_the_motion():
+    # Static, then a fast move, then static again
+    motion = np.array([0.0] * 10 + [5.0] * 10 + [0.0] * 10)
+    keyframes = select_keyframes(motion, 5)
+    assert keyframes[0] == 0
+    assert len(keyframes) <= 5
+    assert all(10 <= index < 20 for index in keyframes[1:])
+    assert select_keyframes(np.zeros(30), 5).tolist() == [0]
+    assert select_keyframes(np.array([]), 5).tolist() == []
+
+def test_keyframe_extraction_reports_the_saved_frames(tmp_path, fake_ffmpeg):
+    # The fake frames move by the same amount between samples: keyframes are evenly spread
+    video_path = make_video(tmp_path / "video.mp4", duration=4.0)
+    with open(tmp_path / "ffmpeg_log.txt", "w+") as log:
+        ffmpeg_run(video_path, tmp_path, fps=2, keyframe_budget=5, max_size=32, stream_file=log)
+    frames = sorted((tmp_path / "input").iterdir())
+    assert len(frames) == 5
+    with Image.open(frames[1]) as image:
+        assert image.size == (32, 24)
+        # The green channel carries the index of the analysed sample
+        assert abs(image.getpixel((0, 0))[1] - 7) <= 2
+    # 32 samples at 8 fps, 8 frames at a fixed 2 fps
+    report = (tmp_path / "ffmpeg_log.txt").read_text()
+    assert "Adaptive sampling: 5 keyframes, 3 frames saved vs 2 fps" in report
+    assert "Progress: 100.0%" in report
+
+def test_keyframe_extraction_checks_the_disk_budget(tmp_path, fake_ffmpeg):
+    video_path = make_video(tmp_path / "video.mp4", duration=4.0)
+    with pytest.raises(FailedProcess, match="only 0 MB"):
+        ffmpeg_run(video_path, tmp_path, fps=2, keyframe_budget=5, disk_budget=1)
+    assert not list((tmp_path / "input").iterdir())
+
+def test_streaming_checks_the_disk_budget_with_the_given_ffprobe(tmp_path, fake_ffmpeg):
+    video_path = make_video(tmp_path / "video.mp4", duration=4.0)
+    with pytest.raises(FailedProcess, match="only 0 MB"):
+        ffmpeg_run(video_path, tmp_path, fps=2, streaming=True, disk_budget=1)
+    assert not list((tmp_path / "input").iterdir())
+    with pytest.raises(OSError):
+        ffmpeg_run(video_path, tmp_path, fps=2, streaming=True, ffprobe_command=str(tmp_path / "missing"))
@@ -0,0 +1,35 @@
+from PIL import Image
+from services.cache import FileCache
+from services.frames import ORIENTATION_TAG, resize_frames
+from services.manifest import FrameManifest
+
+def save_frame(path, size, orientation=None):
+    exif = Image.Exif()
+    exif[0x010F] = "Phone"
+    # Focal length, in the Exif sub-IFD
+    exif.get_ifd(0x8769)[0x920A] = 4.2
+    if orientation:
+        exif[ORIENTATION_TAG] = orientation
+    Image.new("RGB", size, (200, 10, 10)).save(path, exif=exif.tobytes())
+
+def test_resize_keeps_exif_and_bakes_orientation(tmp_path):
+    input_path = tmp_path / "input"
+    input_path.mkdir()
+    save_frame(input_path / "large.jpg", (400, 300), orientation=6)
+    save_frame(input_path / "small_rotated.jpg", (80, 60), orientation=6)
+    save_frame(input_path / "small.jpg", (80, 60))
+
+    resized = resize_frames(
+        FrameManifest.load(input_path), tmp_path / "resized", 100, FileCache(tmp_path / "cache"), workers=1
+    )
+
+    sizes = {frame["name"]: (frame["width"], frame["height"]) for frame in resized}
+    assert sizes == {"large.jpg": (75, 100), "small_rotated.jpg": (60, 80), "small.jpg": (80, 60)}
+    for name in sizes:
+        with Image.open(tmp_path / "resized" / name) as image:
+            exif = image.getexif()
+            assert ORIENTATION_TAG not in exif
+            assert exif[0x010F] == "Phone"
+            assert float(exif.get_ifd(0x8769)[0x920A]) == 4.2
+    # Upright frames under the limit are linked, not re-encoded
+    assert (tmp_path / "resized" / "small.jpg").stat().st_ino == (input_path / "small.jpg").stat().st_ino
@@ -0,0 +1,69 @@
+from pathlib import Path
+import pytest
+from services.gaussian_splatting_cuda import FailedTraining, gaussian_splatting_cuda
+
+def train(output_path: Path, gs_command: str, iterations: int = 300, **kwargs) -> list:
+    published = []
+    gaussian_splatting_cuda(
+        data_path=output_path.parent,
+        output_path=output_path,
+        gs_command=gs_command,
+        iterations=iterations,
+        on_snapshot=lambda iteration, path: published.append(iteration),
+        **kwargs,
+    )
+    return published
+
+def test_snapshots_are_published(tmp_path, fake_trainer):
+    output_path = tmp_path / "output"
+    published = train(output_path, fake_trainer)
+    assert published == [100, 200, 300]
+    assert (output_path / "snapshots" / "iteration_200.ply").read_text() == "ply 200\n"
+    assert (output_path / "final_point_cloud.ply").read_text() == "ply 300\n"
+
+def test_resume_skips_a_finished_run_with_the_same_key(tmp_path, fake_trainer):
+    output_path = tmp_path / "output"
+    train(output_path, fake_trainer, resume=True, run_key="a")
+    # The trainer is not run again: a missing binary would fail
+    published = train(output_path, str(tmp_path / "missing"), resume=True, run_key="a")
+    assert published == []
+    assert (output_path / "final_point_cloud.ply").read_text() == "ply 300\n"
+
+def test_resume_discards_the_snapshots_of_another_run(tmp_path, fake_trainer):
+    output_path = tmp_path / "output"
+    train(output_path, fake_trainer, resume=True, run_key="a")
+    published = train(output_path, fake_trainer, iterations=150, resume=True, run_key="b")
+    assert published == [100, 150]
+    assert sorted(path.name for path in (output_path / "point_cloud").iterdir()) == ["iteration_100", "iteration_150"]
+    assert (output_path / "final_point_cloud.ply").read_text() == "ply 150\n"
+
+def test_failed_run_keeps_the_latest_snapshot(tmp_path, fake_trainer, monkeypatch):
+    monkeypatch.setenv("FAKE_TRAINER_FAIL_AT", "250")
+    output_path = tmp_path / "output"
+    with pytest.raises(FailedTraining, match="iteration 200"):
+        train(output_path, fake_trainer)
+    assert (output_path / "final_point_cloud.ply").read_text() == "ply 200\n"
+    assert (output_path / "snapshots" / "iteration_200.ply").exists()
+
+def test_failed_run_without_snapshot_raises(tmp_path, fake_trainer, monkeypatch):
+    monkeypatch.setenv("FAKE_TRAINER_FAIL_AT", "50")
+    with pytest.raises(Exception, match="Error splatting frames"):
+        train(tmp_path / "output", fake_trainer)
+
+class StopAt:
+    def __init__(self, iteration: int):
+        self.iteration = iteration
+
+    def update(self, iteration: int, *metrics) -> str:
+        return "plateau" if iteration >= self.iteration else None
+
+def test_early_stop_keeps_the_last_complete_snapshot(tmp_path, fake_trainer, monkeypatch):
+    monkeypatch.setenv("FAKE_TRAINER_DELAY", "0.005")
+    monkeypatch.setenv("FAKE_TRAINER_STALL_AT", "200")
+    output_path = tmp_path / "output"
+    # Stopped while the snapshot at iteration 200 is being written
+    published = train(output_path, fake_trainer, iterations=300, early_stop=StopAt(200), snapshot_interval=0.05)
+    assert (output_path / "point_cloud" / "iteration_200" / "point_cloud.ply").read_text() == "ply 200"
+    assert published == [100]
+    assert (output_path / "final_point_cloud.ply").read_text() == "ply 100\n"
+    assert not (output_path / "snapshots" / "iteration_200.ply").exists()
@@ -0,0 +1,20 @@
+import threading
+from services.jobs import DONE, QUEUED, RUNNING, JobQueue
+
+def test_trainings_never_hold_the_default_workers(tmp_path):
+    gpu_free = threading.Event()
+    queue = JobQueue(tmp_path / "jobs.sqlite3", workers=1, pools={"training": 1}, poll_interval=0.01)
+    queue.register("train", lambda session_id: gpu_free.wait(5.0), pool="training")
+    queue.register("ffmpeg", lambda session_id: session_id)
+    queue.start()
+    try:
+        trainings = [queue.enqueue(f"train-{index}", "train") for index in range(2)]
+        extraction = queue.enqueue("extract", "ffmpeg")
+        # The trainings wait for the GPU, the extraction still gets a worker
+        assert queue.wait(extraction, timeout=5.0)["status"] == DONE
+        assert [queue.get(job_id)["status"] for job_id in trainings] == [RUNNING, QUEUED]
+        gpu_free.set()
+        assert all(queue.wait(job_id, timeout=5.0)["status"] == DONE for job_id in trainings)
+    finally:
+        gpu_free.set()
+        queue.stop()
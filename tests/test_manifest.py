@@ -0,0 +1,18 @@
+from PIL import Image
+from services.manifest import FrameManifest
+
+def test_unreadable_frames_are_left_out(tmp_path):
+    image_path = tmp_path / "input"
+    image_path.mkdir()
+    for name in ("0001.jpg", "0002.jpg"):
+        Image.new("RGB", (32, 24)).save(image_path / name)
+    (image_path / "0003.jpg").write_bytes(b"\xff\xd8 truncated")
+
+    manifest = FrameManifest.load(image_path)
+    assert manifest.names() == ["0001.jpg", "0002.jpg"]
+
+    # A frame corrupted after it was indexed is dropped on the next refresh
+    (image_path / "0002.jpg").write_bytes(b"not an image")
+    assert manifest.refresh()
+    assert manifest.names() == ["0001.jpg"]
+    assert FrameManifest.load(image_path).names() == ["0001.jpg"]
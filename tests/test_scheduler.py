@@ -0,0 +1,71 @@
+import threading
+import time
+import pytest
+from services.gaussian_splatting_cuda import gaussian_splatting_cuda
+from services.scheduler import TrainingScheduler
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def queue_requests(scheduler: TrainingScheduler, requests: list) -> tuple[list, list]:
+    """Start one waiting thread per (session_id, priority, label), return the grant order and the threads."""
+    order = []
+    threads = []
+    for session_id, priority, label in requests:
+        def run(session_id=session_id, priority=priority, label=label):
+            with scheduler.slot(session_id, priority, poll_interval=0.01):
+                order.append(label)
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+        # Queued one after the other, so that ties keep this order
+        wait_for(lambda: scheduler.stats()["waiting"] == len(threads))
+    return order, threads
+
+def test_priority_ordering():
+    scheduler = TrainingScheduler(devices=1)
+    with scheduler.slot("holder"):
+        order, threads = queue_requests(scheduler, [("a", 5, "low"), ("b", 1, "high"), ("c", 3, "mid")])
+        assert scheduler.position("b") == 0
+        assert scheduler.position("a") == 2
+    for thread in threads:
+        thread.join()
+    assert order == ["high", "mid", "low"]
+
+def test_fair_share_between_sessions():
+    scheduler = TrainingScheduler(devices=1)
+    with scheduler.slot("a"):
+        order, threads = queue_requests(scheduler, [("a", 0, "a1"), ("a", 0, "a2"), ("b", 0, "b1"), ("a", 0, "a3")])
+    for thread in threads:
+        thread.join()
+    # Session a was already served once: b goes first although it queued later
+    assert order == ["b1", "a1", "a2", "a3"]
+
+def test_virtual_devices():
+    scheduler = TrainingScheduler(devices=2, slots_per_device=2)
+    with scheduler.slot("a") as first, scheduler.slot("b") as second, scheduler.slot("c") as third:
+        assert first != second
+        assert third in (first, second)
+        assert sorted(scheduler.stats()["devices"].values()) == [1, 2]
+    assert scheduler.stats()["devices"] == {0: 0, 1: 0}
+
+def test_slot_is_released_when_the_trainer_fails(tmp_path, fake_trainer, monkeypatch):
+    monkeypatch.setenv("FAKE_TRAINER_FAIL_AT", "50")
+    scheduler = TrainingScheduler(devices=2)
+    log_path = tmp_path / "log.txt"
+    with scheduler.slot("other") as other:
+        with pytest.raises(Exception, match="Error splatting frames"):
+            with scheduler.slot("a") as device, log_path.open("w") as log_file:
+                gaussian_splatting_cuda(
+                    tmp_path, tmp_path / "output", fake_trainer,
+                    iterations=100, device=device, stream_file=log_file,
+                )
+        assert device != other
+        assert f"Training on device {device}" in log_path.read_text()
+        assert scheduler.stats() == {"devices": {other: 1, device: 0}, "slots_per_device": 1, "running": {"other": 1}, "waiting": 0}
+    # The failed run freed its device: two new trainings get a slot right away
+    with scheduler.slot("b"), scheduler.slot("c"):
+        assert scheduler.stats()["waiting"] == 0